@@ -2,24 +2,33 @@
 
 This DAG downloads hourly GitHub Archive data, transforms it to Parquet,
 and generates statistics.
+
+Each run expands the fetch_and_transform -> stats chain over every hour in its
+window (one hour for scheduled runs, or the optional backfill_start/backfill_end
+params for manual backfills), so independent hours run concurrently up to the
+download pool limit.
 """
 import logging
 from datetime import datetime, timedelta
-from typing import NamedTuple
+from typing import NamedTuple, Optional
 
 import pendulum
-from airflow.providers.standard.operators.python import PythonOperator
-from airflow.sdk import DAG, Variable
+from airflow.sdk import DAG, Param, Variable, task, task_group
 from airflow.timetables.interval import CronDataIntervalTimetable
 
 
-from gh_archive.jobs.fetch import download_file
+from gh_archive.jobs.fetch_transform import fetch_and_transform
 from gh_archive.jobs.stats import generate_stats
-from gh_archive.jobs.transform import transform_json_to_parquet
 from gh_archive.utils.paths import get_gh_archive_url
 
 logger = logging.getLogger(__name__)
 
+# Pool limiting concurrent downloads from GH Archive (created by airflow-init)
+FETCH_POOL = "gh_archive_fetch"
+
+# Default number of concurrent DAG runs; hours are independent of each other
+DEFAULT_MAX_ACTIVE_RUNS = 8
+
 
 class Paths(NamedTuple):
     """Container for all paths used in the pipeline."""
@@ -29,14 +38,27 @@ class Paths(NamedTuple):
     url: str
 
 
-def _get_dir(variable_name: str, default: str) -> str:
-    """Get directory from Airflow Variable or use default."""
+def _get_variable(variable_name: str, default: str) -> str:
+    """Get an Airflow Variable or use default."""
     try:
         return Variable.get(variable_name)
     except Exception:
         return default
 
 
+def _get_max_active_runs() -> int:
+    """Get the run concurrency from its Airflow Variable, or the default if it is not a positive integer."""
+    value = _get_variable("GH_ARCHIVE_MAX_ACTIVE_RUNS", str(DEFAULT_MAX_ACTIVE_RUNS))
+    try:
+        max_active_runs = int(value)
+    except ValueError:
+        max_active_runs = 0
+    if max_active_runs < 1:
+        logger.warning(f"Invalid GH_ARCHIVE_MAX_ACTIVE_RUNS {value!r}, using {DEFAULT_MAX_ACTIVE_RUNS}")
+        return DEFAULT_MAX_ACTIVE_RUNS
+    return max_active_runs
+
+
 def build_paths(dt: datetime, raw_dir: str, clean_dir: str, stats_dir: str) -> Paths:
     """
     Build all paths for a given datetime.
@@ -63,6 +85,28 @@ def build_paths(dt: datetime, raw_dir: str, clean_dir: str, stats_dir: str) -> P
     return Paths(raw_path=raw_path, clean_path=clean_path, stats_path=stats_path, url=url)
 
 
+def hours_in_interval(start: datetime, end: datetime) -> list[datetime]:
+    """
+    List the start of every complete hour between start and end.
+    
+    Args:
+        start: Interval start (truncated to the hour)
+        end: Interval end (exclusive)
+    
+    Returns:
+        List of hourly datetimes; always contains at least the hour of start
+    """
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    hours = []
+    while not hours or hour + timedelta(hours=1) <= end:
+        hours.append(hour)
+        hour += timedelta(hours=1)
+    return hours
+
+
+# Retrieve run concurrency once at DAG level
+MAX_ACTIVE_RUNS = _get_max_active_runs()
+
 with DAG(
     dag_id="gh_archive_hourly",
     description="Download and process hourly GH Archive data",
@@ -77,56 +121,53 @@ with DAG(
         "retries": 2,
         "retry_delay": timedelta(minutes=5),
     },
+    params={
+        "backfill_start": Param(None, type=["null", "string"], description="First hour to process (ISO 8601, manual backfills)"),
+        "backfill_end": Param(None, type=["null", "string"], description="End of the backfill window, exclusive (ISO 8601)"),
+    },
     tags=["gh-archive", "github", "data-pipeline"],
-    max_active_runs=1,  # Only one run at a time
+    max_active_runs=MAX_ACTIVE_RUNS,  # Downloads stay capped by FETCH_POOL
 ) as dag:
     
     # Retrieve directory variables once at DAG level
-    RAW_DIR = _get_dir("GH_ARCHIVE_RAW_DIR", "./data/raw")
-    CLEAN_DIR = _get_dir("GH_ARCHIVE_CLEAN_DIR", "./data/clean")
-    STATS_DIR = _get_dir("GH_ARCHIVE_STATS_DIR", "./data/stats")
+    RAW_DIR = _get_variable("GH_ARCHIVE_RAW_DIR", "./data/raw")
+    CLEAN_DIR = _get_variable("GH_ARCHIVE_CLEAN_DIR", "./data/clean")
+    STATS_DIR = _get_variable("GH_ARCHIVE_STATS_DIR", "./data/stats")
+    KEEP_RAW = _get_variable("GH_ARCHIVE_KEEP_RAW", "false").lower() == "true"
     
-    def fetch_task(**context):
-        """Fetch hourly archive data."""
-        # Use data_interval_start directly (no need to subtract 1 hour with interval-based timetable)
-        data_interval_start = context["data_interval_start"]
-        paths = build_paths(data_interval_start, RAW_DIR, CLEAN_DIR, STATS_DIR)
-        
-        logger.info(f"Fetching data for {data_interval_start}: {paths.url} -> {paths.raw_path}")
-        return download_file(paths.url, paths.raw_path, overwrite=False)
+    @task
+    def list_partitions(
+        params: Optional[dict] = None,
+        data_interval_start: Optional[datetime] = None,
+        data_interval_end: Optional[datetime] = None,
+    ) -> list[dict]:
+        """Build the paths of every hour to process (the data interval unless a backfill window is given)."""
+        params = params or {}
+        start = pendulum.parse(params["backfill_start"]) if params.get("backfill_start") else data_interval_start
+        end = pendulum.parse(params["backfill_end"]) if params.get("backfill_end") else data_interval_end
+        hours = hours_in_interval(start, end)
+        logger.info(f"Processing {len(hours)} hour(s) from {hours[0]} to {hours[-1]}")
+        return [build_paths(hour, RAW_DIR, CLEAN_DIR, STATS_DIR)._asdict() for hour in hours]
     
-    def transform_task(**context):
-        """Transform JSON.gz to Parquet."""
-        data_interval_start = context["data_interval_start"]
-        paths = build_paths(data_interval_start, RAW_DIR, CLEAN_DIR, STATS_DIR)
+    @task(task_id="fetch_and_transform", pool=FETCH_POOL)
+    def fetch_transform_task(paths: dict) -> str:
+        """Stream hourly archive data straight into Parquet."""
+        raw_path = paths["raw_path"] if KEEP_RAW else None
         
-        logger.info(f"Transforming data for {data_interval_start}: {paths.raw_path} -> {paths.clean_path}")
-        return transform_json_to_parquet(paths.raw_path, paths.clean_path, overwrite=False)
+        logger.info(f"Fetching and transforming data: {paths['url']} -> {paths['clean_path']}")
+        return fetch_and_transform(paths["url"], paths["clean_path"], raw_path=raw_path, overwrite=False)
     
-    def stats_task(**context):
+    @task(task_id="generate_stats")
+    def stats_task(paths: dict) -> str:
         """Generate statistics from Parquet."""
-        data_interval_start = context["data_interval_start"]
-        paths = build_paths(data_interval_start, RAW_DIR, CLEAN_DIR, STATS_DIR)
-        
-        logger.info(f"Generating stats for {data_interval_start}: {paths.clean_path} -> {paths.stats_path}")
-        return generate_stats(paths.clean_path, paths.stats_path, overwrite=False)
-    
-    # Define tasks
-    fetch = PythonOperator(
-        task_id="fetch_hourly_archive",
-        python_callable=fetch_task,
-    )
+        logger.info(f"Generating stats: {paths['clean_path']} -> {paths['stats_path']}")
+        return generate_stats(paths["clean_path"], paths["stats_path"], overwrite=False)
     
-    transform = PythonOperator(
-        task_id="transform_to_parquet",
-        python_callable=transform_task,
-    )
+    @task_group
+    def process_hour(paths: dict):
+        """Fetch, transform and summarize a single hour."""
+        # Define task dependencies
+        fetch_transform_task(paths) >> stats_task(paths)
     
-    stats = PythonOperator(
-        task_id="generate_stats",
-        python_callable=stats_task,
-    )
-    
-    # Define task dependencies
-    fetch >> transform >> stats
-
+    # Map the per-hour chain over every hour in the run's window
+    process_hour.expand(paths=list_partitions())
@@ -1,20 +1,166 @@
 """Download GH Archive hourly data files."""
 import logging
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from gh_archive.utils.io import ensure_dir, fsync_dir
 
 logger = logging.getLogger(__name__)
 
+# Bytes read from the response per iteration; larger reads mean fewer
+# Python iterations and write() syscalls per archive
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Retry policy for transient connection failures and server errors
+DOWNLOAD_RETRY = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+
+
+def _new_session() -> requests.Session:
+    """Create an HTTP session with a keep-alive connection pool and retries."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=DOWNLOAD_RETRY)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _content_length(response: requests.Response) -> int:
+    """Return the response's Content-Length, or 0 if unknown or invalid."""
+    try:
+        return max(int(response.headers.get("Content-Length")), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+# Shared across downloads so back-to-back hours reuse TCP/TLS connections
+_SESSION = _new_session()
+
+
+def get_session() -> requests.Session:
+    """Return the shared download session, for callers that stream archives themselves."""
+    return _SESSION
+
+
+def _etag(response: requests.Response) -> Optional[str]:
+    """Return the response's ETag header, if any."""
+    return response.headers.get("ETag") or None
 
-def download_file(url: str, output_path: str, overwrite: bool = False) -> str:
+
+def _range_total(response: requests.Response) -> Optional[int]:
+    """Total size of the remote file from Content-Range (e.g. `bytes */1234` on a 416), if given."""
+    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+def _etag_path(path: Path) -> Path:
+    """Path of the sidecar file storing the ETag a download was fetched with."""
+    return path.with_name(f"{path.name}.etag")
+
+
+def _read_etag(path: Path) -> Optional[str]:
+    """Read a stored ETag sidecar, or None if there is none."""
+    try:
+        return path.read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _is_up_to_date(url: str, output_path: Path) -> bool:
+    """
+    Check with a HEAD request whether an existing download matches the remote file.
+    
+    The file is considered stale if the remote ETag differs from the stored
+    sidecar, or if its size differs from the remote Content-Length (e.g. a
+    truncated file left by an earlier crash). If the server cannot be reached,
+    the existing file is kept.
+    
+    Args:
+        url: URL the file was downloaded from
+        output_path: Existing downloaded file
+    
+    Returns:
+        True if the existing file can be kept
+    """
+    try:
+        r = _SESSION.head(url, timeout=60, allow_redirects=True)
+        r.raise_for_status()
+    except requests.RequestException as e:
+        logger.warning(f"Could not verify {output_path} against {url}, keeping it: {e}")
+        return True
+    
+    stored_etag = _read_etag(_etag_path(output_path))
+    remote_etag = _etag(r)
+    if stored_etag and remote_etag and stored_etag != remote_etag:
+        return False
+    length = _content_length(r)
+    return not length or length == output_path.stat().st_size
+
+
+def _write_body(response: requests.Response, tmp_path: Path, appending: bool, chunk_size: int, durable: bool) -> None:
+    """
+    Copy a streamed response body into the download's temp file.
+    
+    Args:
+        response: Streaming response with the body (or, if appending, the rest of it)
+        tmp_path: Temp file to write
+        appending: If True, append to the partial file instead of replacing it
+        chunk_size: Number of bytes to read from the response at a time
+        durable: If True, fsync the file after writing
+    """
+    # The archive is already gzip - copy the raw bytes as-is, in C,
+    # instead of iterating Python chunks via iter_content
+    response.raw.decode_content = False
+    flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if appending else os.O_TRUNC)
+    fd = os.open(tmp_path, flags, 0o644)
+    with os.fdopen(fd, "ab" if appending else "wb") as f:
+        # Reserve the whole file up front to avoid fragmented extents
+        length = 0 if appending else _content_length(response)
+        if length and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, length)
+            except OSError:
+                pass  # Not supported by this filesystem
+        shutil.copyfileobj(response.raw, f, length=chunk_size)
+        # Drop any preallocated space past what was actually received
+        f.truncate(f.tell())
+        if durable:
+            f.flush()
+            os.fsync(fd)
+
+
+def download_file(
+    url: str,
+    output_path: str,
+    overwrite: bool = False,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    resume: bool = False,
+    durable: bool = True,
+) -> str:
     """
     Download a file from URL and save it to the specified path.
     
+    An existing file is only kept if a HEAD request shows it still matches the
+    remote file (see _is_up_to_date); the ETag of every download is stored in
+    a `<file>.etag` sidecar for that check.
+    
     Args:
         url: URL to download from
         output_path: Path where the file should be saved (directory will be created if needed)
-        overwrite: If True, overwrite existing file. If False, skip if file exists.
+        overwrite: If True, overwrite existing file. If False, skip if an up-to-date file exists.
+        chunk_size: Number of bytes to read from the response at a time
+        resume: If True, keep partial downloads on failure and continue them
+            with a Range request next time, as long as the remote ETag is unchanged
+        durable: If True, fsync the file before the rename and its directory
+            after it, so a crash leaves either the old file or the complete new
+            one. If False, skip both fsyncs for speed.
     
     Returns:
         String path to the downloaded file
@@ -22,36 +168,110 @@ def download_file(url: str, output_path: str, overwrite: bool = False) -> str:
     output_path = Path(output_path)
     
     # Create parent directory if it doesn't exist
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    ensure_dir(output_path.parent)
     
     if output_path.exists() and not overwrite:
-        logger.info(f"File already exists: {output_path}")
-        return str(output_path)
+        if _is_up_to_date(url, output_path):
+            logger.info(f"File already exists: {output_path}")
+            return str(output_path)
+        logger.info(f"Existing file is stale or incomplete: {output_path}")
 
     logger.info(f"Downloading {url} -> {output_path}")
 
     tmp_path = output_path.parent / f".{output_path.name}.tmp"
+    tmp_etag_path = _etag_path(tmp_path)
+
+    # Continue a partial download only if it is known which version it came from;
+    # If-Range makes the server send the whole file if that version changed
+    headers = {}
+    offset = tmp_path.stat().st_size if resume and tmp_path.exists() else 0
+    partial_etag = _read_etag(tmp_etag_path) if offset else None
+    if partial_etag:
+        headers = {"Range": f"bytes={offset}-", "If-Range": partial_etag}
+        logger.info(f"Resuming {url} from byte {offset}")
 
     try:
-        with requests.get(url, stream=True, timeout=300) as r:
-            r.raise_for_status()
-            with open(tmp_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=1024 * 1024):  # 1MB
-                    if chunk:
-                        f.write(chunk)
-
-        # atomic replace
+        restart = False
+        with _SESSION.get(url, stream=True, timeout=300, headers=headers) as r:
+            if headers and r.status_code == 416:
+                # Nothing past the partial file: it already holds the whole body
+                # (e.g. after a crash before the rename), unless the remote changed
+                etag = partial_etag
+                restart = _range_total(r) != offset or _etag(r) not in (None, partial_etag)
+            else:
+                r.raise_for_status()
+                etag = _etag(r)
+                appending = bool(headers) and r.status_code == 206
+                if resume and not appending:
+                    if etag:
+                        tmp_etag_path.write_text(etag)
+                    else:
+                        tmp_etag_path.unlink(missing_ok=True)
+                _write_body(r, tmp_path, appending, chunk_size, durable)
+        
+        if restart:
+            logger.info(f"Partial download does not match {url}, starting over")
+            tmp_path.unlink()
+            tmp_etag_path.unlink(missing_ok=True)
+            return download_file(url, output_path, overwrite=True, chunk_size=chunk_size, resume=resume, durable=durable)
+
+        # atomic replace, made durable by syncing the directory entry
         tmp_path.replace(output_path)
+        if durable:
+            fsync_dir(output_path.parent)
+        
+        # Remember which version was downloaded for the next up-to-date check
+        if etag:
+            _etag_path(output_path).write_text(etag)
+        else:
+            _etag_path(output_path).unlink(missing_ok=True)
+        tmp_etag_path.unlink(missing_ok=True)
 
         logger.info(f"Downloaded OK: {output_path}")
         return str(output_path)
 
     except Exception:
-        # cleanup temp on failure
-        if tmp_path.exists():
-            try:
-                tmp_path.unlink()
-            except Exception:
-                pass
+        # cleanup temp on failure, unless it can be resumed later
+        if not resume:
+            for path in (tmp_path, tmp_etag_path):
+                if path.exists():
+                    try:
+                        path.unlink()
+                    except Exception:
+                        pass
         raise
 
+
+def download_files(
+    url_path_pairs: Iterable[tuple[str, Union[str, Path]]],
+    max_concurrency: int = 8,
+    overwrite: bool = False,
+) -> Iterator[str]:
+    """
+    Download several files concurrently, keeping a bounded number in flight.
+    
+    A new download starts only when one finishes, so at most max_concurrency
+    requests run at a time no matter how many pairs are given. Downloads share
+    the pooled session, so connections are reused across files.
+    
+    Args:
+        url_path_pairs: Iterable of (url, output_path) pairs
+        max_concurrency: Maximum number of simultaneous downloads
+        overwrite: If True, overwrite existing files. If False, skip files that exist.
+    
+    Yields:
+        String path of each downloaded file, in completion order
+    """
+    pairs = iter(url_path_pairs)
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        in_flight: set[Future] = {
+            pool.submit(download_file, url, output_path, overwrite)
+            for url, output_path in islice(pairs, max_concurrency)
+        }
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            # Refill one slot per finished download
+            for url, output_path in islice(pairs, len(done)):
+                in_flight.add(pool.submit(download_file, url, output_path, overwrite))
+            for future in done:
+                yield future.result()
@@ -0,0 +1,111 @@
+"""Download a GH Archive file and transform it to Parquet in a single pass."""
+import contextlib
+import io
+import logging
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+from isal import igzip
+
+from gh_archive.jobs.fetch import get_session
+from gh_archive.jobs.transform import transform_json_to_parquet, write_events_parquet
+from gh_archive.utils.io import drop_page_cache, durable_replace, new_temp_file
+
+logger = logging.getLogger(__name__)
+
+
+class _TeeReader(io.RawIOBase):
+    """Readable stream that copies every byte read from source into sink."""
+
+    def __init__(self, source: BinaryIO, sink: BinaryIO):
+        self._source = source
+        self._sink = sink
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self._source.readinto(buffer)
+        if n:
+            self._sink.write(memoryview(buffer)[:n])
+        return n
+
+
+def fetch_and_transform(
+    url: str,
+    output_parquet_path: Union[str, Path],
+    raw_path: Optional[Union[str, Path]] = None,
+    overwrite: bool = False,
+) -> str:
+    """
+    Stream a GH Archive file from URL straight into a Parquet file.
+
+    The HTTP response is decompressed and parsed as it arrives, so the JSON.gz
+    never has to be written to disk and read back. If raw_path is given, the
+    downloaded bytes are also kept there; if that file already exists, it is
+    transformed instead of downloading again.
+
+    Args:
+        url: URL of the GH Archive JSON.gz file
+        output_parquet_path: Path where the Parquet file should be saved (string or Path)
+        raw_path: Optional path to keep a copy of the raw JSON.gz (string or Path)
+        overwrite: If True, overwrite existing files. If False, skip if the Parquet file exists.
+
+    Returns:
+        String path to the output Parquet file
+    """
+    # Convert strings to Path if needed
+    output_parquet_path = Path(output_parquet_path)
+    raw_path = Path(raw_path) if raw_path is not None else None
+
+    # Create parent directories if they don't exist
+    output_parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    if raw_path is not None:
+        raw_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Skip if parquet already exists and not overwriting
+    if output_parquet_path.exists() and not overwrite:
+        logger.info(f"Parquet file already exists: {output_parquet_path}")
+        return str(output_parquet_path)
+
+    # Reuse a previously downloaded archive instead of fetching it again
+    if raw_path is not None and raw_path.exists() and not overwrite:
+        logger.info(f"Raw file already exists, transforming it: {raw_path}")
+        return transform_json_to_parquet(raw_path, output_parquet_path, overwrite=overwrite)
+
+    logger.info(f"Streaming {url} -> {output_parquet_path}")
+
+    # Use uniquely named temporary files for atomic writes
+    temp_path = new_temp_file(output_parquet_path)
+    raw_temp_path = new_temp_file(raw_path) if raw_path is not None else None
+
+    try:
+        with get_session().get(url, stream=True, timeout=300) as r:
+            r.raise_for_status()
+            # Keep the gzip bytes as-is; decompression happens below
+            r.raw.decode_content = False
+
+            with contextlib.ExitStack() as stack:
+                source = r.raw
+                if raw_temp_path is not None:
+                    source = _TeeReader(source, stack.enter_context(open(raw_temp_path, "wb")))
+                with igzip.GzipFile(fileobj=source, mode="rb") as stream:
+                    total_events = write_events_parquet(stream, temp_path)
+
+        # Atomic, durable renames
+        durable_replace(temp_path, output_parquet_path)
+        if raw_temp_path is not None:
+            durable_replace(raw_temp_path, raw_path)
+            # The raw copy is only kept for later; don't let it crowd the page cache
+            drop_page_cache(raw_path)
+
+        logger.info(f"Streamed OK: {output_parquet_path} ({total_events} events)")
+        return str(output_parquet_path)
+
+    except Exception as e:
+        logger.error(f"Failed to stream {url}: {e}")
+        # Clean up temp files on error
+        for path in (temp_path, raw_temp_path):
+            if path is not None and path.exists():
+                path.unlink()
+        raise
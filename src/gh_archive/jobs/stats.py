@@ -1,13 +1,167 @@
 """Generate statistics from Parquet files."""
-import json
+import hashlib
 import logging
+import os
 from pathlib import Path
 from typing import Union
 
-import pandas as pd
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from gh_archive.utils.io import atomic_write_binary, ensure_dir
 
 logger = logging.getLogger(__name__)
 
+# Columns read from the Parquet file; all others are never loaded
+STATS_COLUMNS = ["type", "actor_login", "repo_name"]
+
+# Number of entries in each top_* breakdown
+TOP_N = 10
+
+# Rows read from the Parquet file at a time
+STATS_BATCH_SIZE = 1 << 16
+
+# Bytes hashed from each end of the input for its signature
+SIGNATURE_BLOCK_SIZE = 64 * 1024
+
+# Stats key recording the signature of the Parquet file they were built from
+SOURCE_SIGNATURE_KEY = "_src_sig"
+
+
+def _count_batch(batch: pa.RecordBatch, column: str) -> pa.Table:
+    """
+    Count rows per value of a column in one record batch.
+    
+    Args:
+        batch: Record batch containing the column
+        column: Name of the column to group by
+    
+    Returns:
+        Table with `column` (plain, not dictionary-encoded) and `count_all` columns
+    """
+    # Group on the batch's dictionary indices, then decode only the distinct keys.
+    # Single-threaded grouping keeps first-seen order, so ties sort deterministically
+    counts = pa.Table.from_batches([batch.select([column])]).group_by(column, use_threads=False).aggregate(
+        [([], "count_all")]
+    )
+    keys = counts[column]
+    if pa.types.is_dictionary(keys.type):
+        counts = counts.set_column(0, column, keys.cast(keys.type.value_type))
+    return counts
+
+
+def _merge_counts(counts: list[pa.Table], column: str) -> pa.Table:
+    """Combine partial _count_batch results into one count per value."""
+    if len(counts) == 1:
+        return counts[0]
+    merged = pa.concat_tables(counts).group_by(column, use_threads=False).aggregate([("count_all", "sum")])
+    return merged.rename_columns([column, "count_all"])
+
+
+def _count_by_value(parquet_file: pq.ParquetFile, columns: list[str]) -> dict[str, pa.Table]:
+    """
+    Count rows per non-null value of each column, streaming the file in batches.
+    
+    Only one batch and the running counts are held in memory, so memory grows
+    with the number of distinct values rather than the number of rows.
+    
+    Args:
+        parquet_file: Open Parquet file
+        columns: Names of the columns to count
+    
+    Returns:
+        Mapping of column name to a table with `column` and `count_all` columns,
+        in first-seen order
+    """
+    partials: dict[str, list[pa.Table]] = {name: [] for name in columns}
+    # Column chunks are decompressed and decoded in parallel on Arrow's thread pool
+    for batch in parquet_file.iter_batches(batch_size=STATS_BATCH_SIZE, columns=columns, use_threads=True):
+        for name in columns:
+            pending = partials[name]
+            pending.append(_count_batch(batch, name))
+            # Fold partial counts into the running total once they outgrow it
+            if sum(t.num_rows for t in pending[1:]) >= pending[0].num_rows:
+                partials[name] = [_merge_counts(pending, name)]
+    
+    counts = {}
+    for name, pending in partials.items():
+        merged = _merge_counts(pending, name)
+        counts[name] = merged.filter(pc.is_valid(merged[name]))
+    return counts
+
+
+def _top_n(counts: pa.Table, n: int = TOP_N) -> pa.Table:
+    """
+    Select the n most frequent values without sorting the whole distribution.
+    
+    Args:
+        counts: Table with a `count_all` column, in first-seen order
+        n: Number of values to keep
+    
+    Returns:
+        The n rows with the highest count_all, most frequent first; ties keep
+        first-seen order
+    """
+    if counts.num_rows > n:
+        # The n-th largest count is a cutoff; only rows reaching it need sorting
+        top = pc.select_k_unstable(counts, k=n, sort_keys=[("count_all", "descending")])
+        cutoff = pc.min(counts["count_all"].take(top))
+        counts = counts.filter(pc.greater_equal(counts["count_all"], cutoff))
+    return counts.sort_by([("count_all", "descending")]).slice(0, n)
+
+
+def _counts_to_dict(counts: pa.Table, column: str) -> dict:
+    """Convert a _count_by_value result to a value -> count dictionary."""
+    return dict(zip(counts[column].to_pylist(), counts["count_all"].to_pylist()))
+
+
+def _source_signature(path: Path) -> str:
+    """
+    Fingerprint a file without reading all of it.
+    
+    Combines size, modification time and a hash of the first and last
+    SIGNATURE_BLOCK_SIZE bytes (for Parquet, the tail holds the footer).
+    
+    Args:
+        path: File to fingerprint
+    
+    Returns:
+        Signature string
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        head = os.pread(f.fileno(), SIGNATURE_BLOCK_SIZE, 0)
+        tail = os.pread(f.fileno(), SIGNATURE_BLOCK_SIZE, max(st.st_size - SIGNATURE_BLOCK_SIZE, 0))
+    digest = hashlib.blake2b(head + tail, digest_size=8).hexdigest()
+    return f"{st.st_size}-{st.st_mtime_ns}-{digest}"
+
+
+def _is_current(output_path: Path, signature: str) -> bool:
+    """
+    Check whether existing stats were built from the input with this signature.
+    
+    Error results are never current, so they are retried on the next run.
+    Stats written before signatures were recorded (no signature and no error)
+    are treated as current.
+    
+    Args:
+        output_path: Existing stats JSON file
+        signature: Signature of the current input (see _source_signature)
+    
+    Returns:
+        True if the existing stats can be kept
+    """
+    try:
+        existing = orjson.loads(output_path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return False
+    if not isinstance(existing, dict) or "error" in existing:
+        return False
+    stored = existing.get(SOURCE_SIGNATURE_KEY)
+    return stored is None or stored == signature
+
 
 def generate_stats(
     parquet_path: Union[str, Path],
@@ -20,7 +174,8 @@ def generate_stats(
     Args:
         parquet_path: Path to the input Parquet file (string or Path)
         output_path: Path where the JSON stats file should be saved (string or Path)
-        overwrite: If True, overwrite existing file. If False, skip if file exists.
+        overwrite: If True, overwrite existing file. If False, skip if the file
+            exists and was generated from the current Parquet file.
     
     Returns:
         String path to the output JSON file
@@ -30,12 +185,16 @@ def generate_stats(
     output_path = Path(output_path) if isinstance(output_path, str) else output_path
     
     # Create parent directory if it doesn't exist
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    ensure_dir(output_path.parent)
     
-    # Skip if output already exists and not overwriting
+    signature = _source_signature(parquet_path) if parquet_path.exists() else None
+    
+    # Skip if output already exists and not overwriting, unless the input changed
     if output_path.exists() and not overwrite:
-        logger.info(f"Stats file already exists: {output_path}")
-        return str(output_path)
+        if signature is None or _is_current(output_path, signature):
+            logger.info(f"Stats file already exists: {output_path}")
+            return str(output_path)
+        logger.info(f"Parquet file changed since stats were generated: {parquet_path}")
     
     if not parquet_path.exists():
         logger.warning(f"Parquet file not found: {parquet_path}")
@@ -45,36 +204,46 @@ def generate_stats(
         }
     else:
         try:
-            # Read Parquet file
-            df = pd.read_parquet(parquet_path, engine="pyarrow")
+            # Stream only the columns the stats need; memory-mapping lets Arrow
+            # read column chunks straight from the page cache instead of copying
+            parquet_file = pq.ParquetFile(parquet_path, memory_map=True)
+            columns = [name for name in STATS_COLUMNS if name in parquet_file.schema_arrow.names]
             
-            if df.empty:
+            if parquet_file.metadata.num_rows == 0:
                 logger.warning(f"Empty Parquet file: {parquet_path}")
                 stats = {
                     "total_events": 0,
                 }
             else:
+                # One grouped count per column; uniques and top-N derive from it
+                counts = _count_by_value(parquet_file, columns)
+                
                 # Generate statistics
                 stats = {
-                    "total_events": len(df),
-                    "event_types": df["type"].value_counts().to_dict() if "type" in df.columns else {},
-                    "unique_actors": df["actor_login"].nunique() if "actor_login" in df.columns else 0,
-                    "unique_repos": df["repo_name"].nunique() if "repo_name" in df.columns else 0,
+                    "total_events": parquet_file.metadata.num_rows,
+                    "event_types": (
+                        _counts_to_dict(counts["type"].sort_by([("count_all", "descending")]), "type")
+                        if "type" in counts else {}
+                    ),
+                    "unique_actors": counts["actor_login"].num_rows if "actor_login" in counts else 0,
+                    "unique_repos": counts["repo_name"].num_rows if "repo_name" in counts else 0,
                 }
                 
                 # Add event type breakdown
-                if "type" in df.columns:
-                    stats["top_event_types"] = df["type"].value_counts().head(10).to_dict()
+                if "type" in counts:
+                    stats["top_event_types"] = _counts_to_dict(_top_n(counts["type"]), "type")
                 
                 # Add top repositories by event count
-                if "repo_name" in df.columns:
-                    stats["top_repos"] = df["repo_name"].value_counts().head(10).to_dict()
+                if "repo_name" in counts:
+                    stats["top_repos"] = _counts_to_dict(_top_n(counts["repo_name"]), "repo_name")
                 
                 # Add top actors by event count
-                if "actor_login" in df.columns:
-                    stats["top_actors"] = df["actor_login"].value_counts().head(10).to_dict()
+                if "actor_login" in counts:
+                    stats["top_actors"] = _counts_to_dict(_top_n(counts["actor_login"]), "actor_login")
                 
                 logger.info(f"Generated stats: {stats['total_events']} events")
+            
+            stats[SOURCE_SIGNATURE_KEY] = signature
         
         except Exception as e:
             logger.error(f"Failed to generate stats for {parquet_path}: {e}")
@@ -83,10 +252,9 @@ def generate_stats(
                 "error": str(e),
             }
     
-    # Write stats to JSON file
+    # Write stats to JSON file atomically
     logger.info(f"Writing stats to {output_path}")
-    with open(output_path, "w") as f:
-        json.dump(stats, f, indent=2)
+    atomic_write_binary(output_path, orjson.dumps(stats, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     
     logger.info(f"Stats written OK: {output_path}")
     return str(output_path)
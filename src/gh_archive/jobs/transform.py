@@ -1,18 +1,158 @@
 """Transform JSON.gz files to Parquet format."""
-import gzip
-import json
 import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Union
+from typing import BinaryIO, Iterator, Optional, Union
 
-import pandas as pd
+import orjson
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
+from isal import igzip
+from pyarrow import json as pa_json
+
+from gh_archive.utils.io import drop_page_cache, durable_replace, new_temp_file
+
+try:
+    import rapidgzip
+except ImportError:  # Optional; files are decompressed with ISA-L igzip instead
+    rapidgzip = None
 
 logger = logging.getLogger(__name__)
 
-# Chunk size for processing events
-CHUNK_SIZE = 10000
+# Rows per Parquet row group; parsed blocks are combined up to this size
+ROW_GROUP_SIZE = 200_000
+
+# Bytes of decompressed NDJSON handed to the parser at a time
+READ_BLOCK_SIZE = 8 << 20
+
+# Threads rapidgzip decompresses with; a single core is faster with igzip
+DECOMPRESS_THREADS = min(8, os.cpu_count() or 1)
+
+# Block size Arrow uses to split a read block across its parser threads
+PARSE_BLOCK_SIZE = 1 << 20
+
+# Output schema, in write order. Low-cardinality strings are dictionary-encoded.
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("type", pa.dictionary(pa.int32(), pa.string())),
+    ("created_at", pa.timestamp("ms", tz="UTC")),
+    ("public", pa.bool_()),
+    ("actor_id", pa.int64()),
+    ("actor_login", pa.string()),
+    ("actor_type", pa.dictionary(pa.int32(), pa.string())),
+    ("repo_id", pa.int64()),
+    ("repo_name", pa.string()),
+    ("repo_url", pa.string()),
+    ("org_id", pa.int64()),
+    ("org_login", pa.string()),
+    ("payload_action", pa.dictionary(pa.int32(), pa.string())),
+    ("payload_size", pa.int64()),
+    ("payload_distinct_size", pa.int64()),
+])
+
+# Event ids are unique, so a Parquet dictionary would only be built and discarded
+_UNIQUE_COLUMNS = ("id",)
+
+# Parquet writer settings for the output files. Dictionary pages are allowed
+# to grow to 2 MiB so actor/repo dictionaries of a full row group still fit.
+PARQUET_WRITE_OPTIONS = {
+    "compression": "zstd",
+    "compression_level": 3,
+    "use_dictionary": [name for name in SCHEMA.names if name not in _UNIQUE_COLUMNS],
+    "dictionary_pagesize_limit": 2 << 20,
+    "write_batch_size": 16384,
+    "data_page_size": 1 << 20,
+}
+
+# Output columns built from Python values as plain strings, then converted
+_DICTIONARY_COLUMNS = ("type", "actor_type", "payload_action")
+_PYTHON_SCHEMA = pa.schema([
+    pa.field(field.name, pa.string()) if field.name in _DICTIONARY_COLUMNS or field.name == "created_at" else field
+    for field in SCHEMA
+])
+
+# Python type each JSON value must have to fill a column of this Arrow type
+_PYTHON_TYPES = {pa.string(): str, pa.int64(): int, pa.bool_(): bool}
+_INT64_RANGE = range(-(1 << 63), 1 << 63)
+
+# Output columns extracted from each event, in write order
+COLUMNS = tuple(SCHEMA.names)
+
+# Subset of the raw event layout that Arrow parses; other fields are ignored
+EVENT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("type", pa.string()),
+    ("created_at", pa.timestamp("ms", tz="UTC")),
+    ("public", pa.bool_()),
+    ("actor", pa.struct([("id", pa.int64()), ("login", pa.string()), ("type", pa.string())])),
+    ("repo", pa.struct([("id", pa.int64()), ("name", pa.string()), ("url", pa.string())])),
+    ("org", pa.struct([("id", pa.int64()), ("login", pa.string())])),
+    ("payload", pa.struct([("action", pa.string()), ("size", pa.int64()), ("distinct_size", pa.int64())])),
+])
+
+_READ_OPTIONS = pa_json.ReadOptions(use_threads=True, block_size=PARSE_BLOCK_SIZE)
+_PARSE_OPTIONS = pa_json.ParseOptions(explicit_schema=EVENT_SCHEMA, unexpected_field_behavior="ignore")
+
+# Shared stand-in for missing nested objects (never mutated)
+_EMPTY: dict = {}
+
+
+def set_important_columns(columns: dict[str, list], row: int, event: dict) -> None:
+    """
+    Store the important columns of a GitHub event at one row of per-column lists.
+    
+    This is the columnar counterpart of extract_important_columns: values go
+    straight into pre-sized lists (see _new_columns), one per output field, so
+    no per-event dict is built and the lists never have to grow.
+    
+    Args:
+        columns: Mapping of column name (see COLUMNS) to the list of values
+        row: Index of the row to fill in every list
+        event: Raw GitHub event dictionary
+    """
+    # Extract common fields
+    event_type = event.get("type")
+    columns["id"][row] = event.get("id")
+    columns["type"][row] = event_type
+    columns["created_at"][row] = event.get("created_at")
+    columns["public"][row] = event.get("public")
+    
+    # Extract actor information
+    actor = event.get("actor")
+    if not isinstance(actor, dict):
+        actor = _EMPTY
+    columns["actor_id"][row] = actor.get("id")
+    columns["actor_login"][row] = actor.get("login")
+    columns["actor_type"][row] = actor.get("type")
+    
+    # Extract repository information
+    repo = event.get("repo")
+    if not isinstance(repo, dict):
+        repo = _EMPTY
+    columns["repo_id"][row] = repo.get("id")
+    columns["repo_name"][row] = repo.get("name")
+    columns["repo_url"][row] = repo.get("url")
+    
+    # Extract organization information if available
+    org = event.get("org")
+    if not isinstance(org, dict):
+        org = _EMPTY
+    columns["org_id"][row] = org.get("id")
+    columns["org_login"][row] = org.get("login")
+    
+    # Extract payload action; commit counts only for PushEvent
+    payload = event.get("payload")
+    if not isinstance(payload, dict):
+        payload = _EMPTY
+    columns["payload_action"][row] = payload.get("action")
+    if event_type == "PushEvent":
+        columns["payload_size"][row] = payload.get("size")
+        columns["payload_distinct_size"][row] = payload.get("distinct_size")
+    else:
+        columns["payload_size"][row] = None
+        columns["payload_distinct_size"][row] = None
 
 
 def extract_important_columns(event: dict) -> dict:
@@ -25,62 +165,309 @@ def extract_important_columns(event: dict) -> dict:
     Returns:
         Dictionary with extracted important fields
     """
-    # Extract common fields
-    extracted = {
-        "id": event.get("id"),
-        "type": event.get("type"),
-        "created_at": event.get("created_at"),
-        "public": event.get("public"),
-    }
+    columns = _new_columns(1)
+    set_important_columns(columns, 0, event)
+    return {name: values[0] for name, values in columns.items()}
+
+
+def _new_columns(size: int) -> dict[str, list]:
+    """Create a per-column buffer of `size` rows for set_important_columns."""
+    return {name: [None] * size for name in COLUMNS}
+
+
+def _iter_line_blocks(stream: BinaryIO, block_size: int = READ_BLOCK_SIZE) -> Iterator[bytearray]:
+    """
+    Read a binary NDJSON stream in blocks that end on a line boundary.
     
-    # Extract actor information
-    actor = event.get("actor", {})
-    if isinstance(actor, dict):
-        extracted["actor_id"] = actor.get("id")
-        extracted["actor_login"] = actor.get("login")
-        extracted["actor_type"] = actor.get("type")
-    else:
-        extracted["actor_id"] = None
-        extracted["actor_login"] = None
-        extracted["actor_type"] = None
+    Each block is read with readinto straight into its own buffer, behind the
+    partial line carried over from the previous block, so the block data is
+    not copied again in Python.
     
-    # Extract repository information
-    repo = event.get("repo", {})
-    if isinstance(repo, dict):
-        extracted["repo_id"] = repo.get("id")
-        extracted["repo_name"] = repo.get("name")
-        extracted["repo_url"] = repo.get("url")
-    else:
-        extracted["repo_id"] = None
-        extracted["repo_name"] = None
-        extracted["repo_url"] = None
+    Args:
+        stream: Decompressed binary stream
+        block_size: Number of bytes to read at a time
     
-    # Extract organization information if available
-    org = event.get("org", {})
-    if isinstance(org, dict):
-        extracted["org_id"] = org.get("id")
-        extracted["org_login"] = org.get("login")
+    Yields:
+        Blocks of whole lines (the final block may lack a trailing newline)
+    """
+    remainder = b""
+    while True:
+        start = len(remainder)
+        block = bytearray(start + block_size)
+        block[:start] = remainder
+        with memoryview(block)[start:] as view:
+            read = stream.readinto(view)
+        if not read:
+            break
+        del block[start + read:]
+        cut = block.rfind(b"\n") + 1
+        if cut == 0:
+            # No newline yet - keep reading until the line is complete
+            remainder = block
+            continue
+        remainder = block[cut:]
+        del block[cut:]
+        yield block
+    if remainder:
+        yield remainder
+
+
+def _parse_block_arrow(block: bytes, read_options: Optional[pa_json.ReadOptions] = None) -> pa.Table:
+    """Parse a block of NDJSON lines with Arrow's native JSON reader (default options: _READ_OPTIONS)."""
+    events = pa_json.read_json(
+        pa.BufferReader(block),
+        read_options=read_options or _READ_OPTIONS,
+        parse_options=_PARSE_OPTIONS,
+    )
+    actor = events.column("actor")
+    repo = events.column("repo")
+    org = events.column("org")
+    payload = events.column("payload")
+    
+    # Commit counts are only meaningful for PushEvent
+    is_push = pc.equal(events.column("type"), "PushEvent")
+    no_size = pa.scalar(None, pa.int64())
+    
+    table = pa.Table.from_arrays(
+        [
+            events.column("id"),
+            pc.dictionary_encode(events.column("type")),
+            events.column("created_at"),
+            events.column("public"),
+            pc.struct_field(actor, "id"),
+            pc.struct_field(actor, "login"),
+            pc.dictionary_encode(pc.struct_field(actor, "type")),
+            pc.struct_field(repo, "id"),
+            pc.struct_field(repo, "name"),
+            pc.struct_field(repo, "url"),
+            pc.struct_field(org, "id"),
+            pc.struct_field(org, "login"),
+            pc.dictionary_encode(pc.struct_field(payload, "action")),
+            pc.if_else(is_push, pc.struct_field(payload, "size"), no_size),
+            pc.if_else(is_push, pc.struct_field(payload, "distinct_size"), no_size),
+        ],
+        schema=SCHEMA,
+    )
+    # The JSON reader does not check UTF-8; raising ArrowInvalid here sends the
+    # block to the line parser, which skips the offending lines
+    table.validate(full=True)
+    return table
+
+
+def _column_array(values: list, arrow_type: pa.DataType) -> pa.Array:
+    """
+    Build a column from JSON values, nulling values Arrow's JSON reader would reject.
+    
+    Args:
+        values: Python values of one column (see set_important_columns)
+        arrow_type: String, int64 or bool column type
+    
+    Returns:
+        Array of arrow_type; values of another JSON type become null
+    """
+    python_type = _PYTHON_TYPES[arrow_type]
+    if python_type is int:
+        # bool is a subclass of int, but JSON true/false is not an integer
+        values = [v if type(v) is int and v in _INT64_RANGE else None for v in values]
     else:
-        extracted["org_id"] = None
-        extracted["org_login"] = None
-    
-    # Extract payload action for certain event types
-    payload = event.get("payload", {})
-    if isinstance(payload, dict):
-        extracted["payload_action"] = payload.get("action")
-        # For PushEvent, extract commit count
-        if event.get("type") == "PushEvent":
-            extracted["payload_size"] = payload.get("size")
-            extracted["payload_distinct_size"] = payload.get("distinct_size")
+        values = [v if isinstance(v, python_type) else None for v in values]
+    return pa.array(values, type=arrow_type)
+
+
+def _parse_timestamps(values: pa.Array) -> pa.Array:
+    """
+    Parse created_at strings with the same rules as Arrow's JSON reader.
+    
+    ISO 8601 values may have fractional seconds and a UTC offset; values
+    without an offset are taken as UTC.
+    
+    Args:
+        values: String array of timestamps
+    
+    Returns:
+        Array of the created_at output type; unparseable values become null
+    """
+    timestamp_type = SCHEMA.field("created_at").type
+    try:
+        return values.cast(timestamp_type)
+    except pa.ArrowInvalid:
+        pass
+    # Some value has no offset or cannot be parsed; convert one at a time
+    parsed = []
+    for value in values:
+        for target in (timestamp_type, pa.timestamp(timestamp_type.unit)):
+            try:
+                parsed.append(value.cast(target).cast(timestamp_type))
+                break
+            except pa.ArrowInvalid:
+                pass
         else:
-            extracted["payload_size"] = None
-            extracted["payload_distinct_size"] = None
-    else:
-        extracted["payload_action"] = None
-        extracted["payload_size"] = None
-        extracted["payload_distinct_size"] = None
+            parsed.append(None)
+    return pa.array(parsed, type=timestamp_type)
+
+
+def _parse_block_lines(block: bytes, first_line_num: int) -> pa.Table:
+    """Parse a block of NDJSON lines one by one, skipping lines that fail."""
+    lines = block.split(b"\n")
+    # Allocate every column once for the whole block; a row that fails
+    # part-way is simply overwritten by the next event
+    columns = _new_columns(len(lines))
+    num_rows = 0
+    for line_num, line in enumerate(lines, first_line_num):
+        line = line.strip()
+        if not line:
+            continue
+        # Only JSON objects are events; reject anything else without parsing it
+        if line[:1] != b"{" or line[-1:] != b"}":
+            logger.warning(f"Skipping line {line_num}: not a JSON object")
+            continue
+        try:
+            event = orjson.loads(line)
+            if event:  # Skip empty events
+                set_important_columns(columns, num_rows, event)
+                num_rows += 1
+        except orjson.JSONDecodeError as e:
+            logger.warning(f"Skipping invalid JSON on line {line_num}: {e}")
+        except Exception as e:
+            logger.warning(f"Error processing line {line_num}: {e}")
+    if num_rows < len(lines):
+        columns = {name: values[:num_rows] for name, values in columns.items()}
+    # A value of the wrong JSON type nulls that field only, not the block
+    arrays = [_column_array(columns[field.name], field.type) for field in _PYTHON_SCHEMA]
+    
+    # Convert to the output types
+    for name in _DICTIONARY_COLUMNS:
+        index = SCHEMA.get_field_index(name)
+        arrays[index] = pc.dictionary_encode(arrays[index])
+    index = SCHEMA.get_field_index("created_at")
+    arrays[index] = _parse_timestamps(arrays[index])
+    return pa.Table.from_arrays(arrays, schema=SCHEMA)
+
+
+def _drop_empty_rows(table: pa.Table) -> pa.Table:
+    """Drop rows in which every extracted field is null, such as `{}` lines."""
+    # Every event has an id, so only blocks with a missing id need the full check
+    if table.num_rows == 0 or table.column("id").null_count == 0:
+        return table
+    has_value = pc.is_valid(table.column(0))
+    for column in table.columns[1:]:
+        has_value = pc.or_(has_value, pc.is_valid(column))
+    return table.filter(has_value)
+
+
+def _parse_block(block: bytes, first_line_num: int) -> pa.Table:
+    """
+    Parse a block of NDJSON lines into a table with the output SCHEMA.
+    
+    Uses Arrow's multi-threaded JSON reader and falls back to a tolerant
+    line-by-line parse when the block contains malformed or unexpected input.
+    Events without any of the extracted fields are skipped on both paths.
+    
+    Args:
+        block: Block of whole NDJSON lines
+        first_line_num: 1-based line number of the first line in the block
     
-    return extracted
+    Returns:
+        pyarrow Table of extracted events
+    """
+    try:
+        try:
+            table = _parse_block_arrow(block)
+        except pa.ArrowInvalid:
+            if len(block) <= _READ_OPTIONS.block_size:
+                raise
+            # An event may straddle Arrow's parse blocks; retry with the block as one piece
+            table = _parse_block_arrow(block, pa_json.ReadOptions(use_threads=False, block_size=len(block)))
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        logger.warning(f"Arrow JSON reader rejected block at line {first_line_num}, parsing it line by line: {e}")
+        table = _parse_block_lines(block, first_line_num)
+    return _drop_empty_rows(table)
+
+
+def open_gzip(path: Path) -> BinaryIO:
+    """
+    Open a gzip file for binary reading.
+    
+    Uses rapidgzip to inflate on DECOMPRESS_THREADS threads when it is
+    installed and more than one core is available, otherwise ISA-L igzip.
+    
+    Args:
+        path: Path to the gzip file
+    
+    Returns:
+        Binary stream of the decompressed content
+    """
+    if rapidgzip is not None and DECOMPRESS_THREADS > 1:
+        return rapidgzip.open(str(path), parallelization=DECOMPRESS_THREADS)
+    return igzip.open(path, "rb")
+
+
+def write_events_parquet(stream: BinaryIO, parquet_path: Union[str, Path]) -> int:
+    """
+    Parse a decompressed NDJSON event stream and write it to a Parquet file.
+    
+    The stream is parsed in blocks of whole lines, one row group at a time, so
+    memory stays bounded regardless of input size. The file is written in place;
+    callers are responsible for writing to a temporary path and renaming.
+    
+    Args:
+        stream: Binary stream of decompressed GitHub event lines
+        parquet_path: Path of the Parquet file to write
+    
+    Returns:
+        Number of events written
+    """
+    total_events = 0
+    line_num = 1
+    
+    # Reading (download/decompression) and encoding each run on a single
+    # thread of their own (both release the GIL), so the next block is read
+    # and the previous row group written while the current block is parsed,
+    # in order. Parsing itself is spread over Arrow's thread pool.
+    with pq.ParquetWriter(parquet_path, schema=SCHEMA, **PARQUET_WRITE_OPTIONS) as parquet_writer:
+        with ThreadPoolExecutor(max_workers=1) as read_pool, ThreadPoolExecutor(max_workers=1) as write_pool:
+            pending_write: Optional[Future] = None
+            
+            def write_row_groups(table: pa.Table) -> Future:
+                """Queue a table for writing, split into ROW_GROUP_SIZE row groups."""
+                if pending_write is not None:
+                    pending_write.result()
+                return write_pool.submit(parquet_writer.write_table, table, row_group_size=ROW_GROUP_SIZE)
+            
+            blocks = _iter_line_blocks(stream)
+            next_block = read_pool.submit(next, blocks, None)
+            row_group: list[pa.Table] = []
+            row_group_rows = 0
+            while True:
+                block = next_block.result()
+                if block is None:
+                    break
+                next_block = read_pool.submit(next, blocks, None)
+                table = _parse_block(block, line_num)
+                line_num += block.count(b"\n")
+                
+                if table.num_rows:
+                    row_group.append(table)
+                    row_group_rows += table.num_rows
+                    if row_group_rows >= ROW_GROUP_SIZE:
+                        # Write whole row groups; the remainder starts the next one
+                        combined = pa.concat_tables(row_group)
+                        full_rows = row_group_rows - row_group_rows % ROW_GROUP_SIZE
+                        pending_write = write_row_groups(combined.slice(0, full_rows))
+                        row_group_rows -= full_rows
+                        row_group = [combined.slice(full_rows)] if row_group_rows else []
+                
+                # Log progress every 100k events
+                if (total_events + table.num_rows) // 100000 > total_events // 100000:
+                    logger.info(f"Processed {total_events + table.num_rows} events so far...")
+                total_events += table.num_rows
+            
+            if row_group:
+                pending_write = write_row_groups(pa.concat_tables(row_group))
+            if pending_write is not None:
+                pending_write.result()
+    
+    return total_events
 
 
 def transform_json_to_parquet(
@@ -113,87 +500,21 @@ def transform_json_to_parquet(
     
     logger.info(f"Transforming {input_gz_path} -> {output_parquet_path}")
     
-    # Use temporary file for atomic write
-    temp_path = output_parquet_path.parent / f".{output_parquet_path.name}.tmp"
+    # Use a uniquely named temporary file for atomic write
+    temp_path = new_temp_file(output_parquet_path)
     
     try:
-        # Process in chunks to avoid memory issues
-        events_chunk = []
-        total_events = 0
-        parquet_writer = None
-        schema = None
+        # Decompress (in parallel if possible) and stream the lines into the Parquet file
+        with open_gzip(input_gz_path) as stream:
+            total_events = write_events_parquet(stream, temp_path)
+        # The raw file is read once; the Parquet output stays cached for the stats task
+        drop_page_cache(input_gz_path)
         
-        with gzip.open(input_gz_path, "rt", encoding="utf-8") as f:
-            for line_num, line in enumerate(f, 1):
-                try:
-                    event = json.loads(line.strip())
-                    if event:  # Skip empty lines
-                        extracted = extract_important_columns(event)
-                        events_chunk.append(extracted)
-                        total_events += 1
-                        
-                        # Process chunk when it reaches CHUNK_SIZE
-                        if len(events_chunk) >= CHUNK_SIZE:
-                            df_chunk = pd.DataFrame(events_chunk)
-                            
-                            # Initialize writer with schema from first chunk
-                            if parquet_writer is None:
-                                table = pa.Table.from_pandas(df_chunk)
-                                schema = table.schema
-                                parquet_writer = pq.ParquetWriter(
-                                    temp_path,
-                                    schema=schema,
-                                    compression="snappy",
-                                )
-                            
-                            # Write chunk - convert to match schema if needed
-                            table = pa.Table.from_pandas(df_chunk)
-                            # Cast to match original schema to ensure consistency
-                            if schema is not None:
-                                table = table.cast(schema)
-                            parquet_writer.write_table(table)
-                            events_chunk = []
-                            
-                            # Log progress every 100k events
-                            if total_events % 100000 == 0:
-                                logger.info(f"Processed {total_events} events so far...")
-                                
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Skipping invalid JSON on line {line_num}: {e}")
-                    continue
-                except Exception as e:
-                    logger.warning(f"Error processing line {line_num}: {e}")
-                    continue
-        
-        # Write remaining events
-        if events_chunk:
-            df_chunk = pd.DataFrame(events_chunk)
-            if parquet_writer is None:
-                # First and only chunk
-                table = pa.Table.from_pandas(df_chunk)
-                schema = table.schema
-                parquet_writer = pq.ParquetWriter(
-                    temp_path,
-                    schema=schema,
-                    compression="snappy",
-                )
-            table = pa.Table.from_pandas(df_chunk)
-            # Cast to match original schema if needed
-            if schema is not None:
-                table = table.cast(schema)
-            parquet_writer.write_table(table)
-        
-        # Close writer
-        if parquet_writer is not None:
-            parquet_writer.close()
-        else:
-            # No events found - create empty parquet file
+        if total_events == 0:
             logger.warning(f"No valid events found in {input_gz_path}")
-            df_empty = pd.DataFrame()
-            df_empty.to_parquet(temp_path, engine="pyarrow", compression="snappy", index=False)
         
-        # Atomic rename
-        temp_path.replace(output_parquet_path)
+        # Atomic, durable rename
+        durable_replace(temp_path, output_parquet_path)
         
         logger.info(f"Transformed OK: {output_parquet_path} ({total_events} events)")
         return str(output_parquet_path)
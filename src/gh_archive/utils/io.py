@@ -2,35 +2,152 @@
 import os
 import shutil
 import tempfile
+import threading
 from pathlib import Path
-from typing import BinaryIO, TextIO
+from typing import BinaryIO, Iterable, TextIO, Union
 
+# Buffer size for streamed writes and the userspace fallback copy
+COPY_BUFFER_SIZE = 1 << 20
 
-def atomic_write_binary(file_path: Path, content: bytes) -> None:
+# Directories this process has already created, so repeated writes into the
+# same partition skip the stat/mkdir syscalls
+_CREATED_DIRS: set[str] = set()
+_CREATED_DIRS_LOCK = threading.Lock()
+
+
+def ensure_dir(directory: Path) -> None:
+    """
+    Create a directory (and its parents) once per process.
+    
+    Args:
+        directory: Directory path (string or Path)
+    """
+    key = str(directory)
+    if key in _CREATED_DIRS:
+        return
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    with _CREATED_DIRS_LOCK:
+        _CREATED_DIRS.add(key)
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    """Write all of data to a file descriptor, retrying short writes."""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def fsync_dir(directory: Path) -> None:
+    """Flush a directory entry (e.g. after a rename) to disk."""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def new_temp_file(file_path: Path) -> Path:
+    """
+    Create a uniquely named, empty temporary file next to a target file.
+    
+    The name is unique per call, so concurrent writers of the same target
+    never share a temp file. Pass the result to durable_replace when done.
+    
+    Args:
+        file_path: Target file path
+    
+    Returns:
+        Path of the temporary file, in the target's directory
+    """
+    file_path = Path(file_path)
+    fd, temp_name = tempfile.mkstemp(prefix=f".{file_path.name}.", suffix=".tmp", dir=file_path.parent)
+    try:
+        # mkstemp creates 0600 files; use the same mode as the other writers
+        os.fchmod(fd, 0o644)
+    finally:
+        os.close(fd)
+    return Path(temp_name)
+
+
+def durable_replace(temp_path: Path, file_path: Path) -> None:
+    """
+    Atomically move a fully written temporary file over its target.
+    
+    The data is fsync'ed before the rename and the directory after it, so a
+    crash leaves either the old file or the complete new one.
+    
+    Args:
+        temp_path: Temporary file in the target's directory
+        file_path: Target file path
+    """
+    fd = os.open(temp_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(temp_path, file_path)
+    fsync_dir(Path(file_path).parent)
+
+
+def drop_page_cache(file_path: Path) -> None:
+    """
+    Advise the kernel to evict a file's pages from the page cache.
+    
+    For files that are read or written once, so they do not push data that is
+    still needed out of memory. Only clean pages are dropped, so call this
+    after the file has been fsync'ed. Does nothing where posix_fadvise is not
+    available.
+    
+    Args:
+        file_path: File whose cached pages are no longer needed
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_binary(file_path: Path, content: Union[bytes, Iterable[bytes], BinaryIO]) -> None:
     """
     Atomically write binary content to a file.
     
-    Uses a temporary file and rename to ensure atomicity.
+    Uses a temporary file and rename to ensure atomicity. The data and the
+    rename are fsync'ed, so the file survives a crash either complete or not
+    at all. Content may be streamed as an iterable of chunks or a binary
+    file-like object instead of being materialized as one bytes object.
     
     Args:
         file_path: Target file path
-        content: Binary content to write
+        content: Bytes, an iterable of bytes chunks, or a readable binary file
     """
     file_path = Path(file_path)
     file_path.parent.mkdir(parents=True, exist_ok=True)
     
-    # Write to temporary file in same directory
-    temp_file = file_path.parent / f".{file_path.name}.tmp"
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        chunks: Iterable[bytes] = (content,)
+    elif hasattr(content, "read"):
+        chunks = iter(lambda: content.read(COPY_BUFFER_SIZE), b"")
+    else:
+        chunks = content
+    
+    # Write to a uniquely named temporary file in the same directory
+    temp_file = new_temp_file(file_path)
     
     try:
-        with open(temp_file, "wb") as f:
-            f.write(content)
-        # Atomic rename
-        temp_file.replace(file_path)
+        fd = os.open(temp_file, os.O_WRONLY)
+        try:
+            for chunk in chunks:
+                _write_all(fd, chunk)
+        finally:
+            os.close(fd)
+        durable_replace(temp_file, file_path)
     except Exception:
         # Clean up temp file on error
-        if temp_file.exists():
-            temp_file.unlink()
+        temp_file.unlink(missing_ok=True)
         raise
 
 
@@ -48,6 +165,33 @@ def atomic_write_text(file_path: Path, content: str, encoding: str = "utf-8") ->
     atomic_write_binary(file_path, content.encode(encoding))
 
 
+def _copy_file_contents(source: BinaryIO, destination: BinaryIO) -> None:
+    """
+    Copy file contents in the kernel where possible.
+    
+    Uses os.copy_file_range (Linux), which avoids a userspace buffer and can
+    reflink on filesystems that support it; falls back to shutil.copyfileobj.
+    
+    Args:
+        source: Source file opened for binary reading
+        destination: Destination file opened for binary writing
+    """
+    try:
+        copied = 0
+        while written := os.copy_file_range(source.fileno(), destination.fileno(), 1 << 30):
+            copied += written
+        # Some filesystems (e.g. procfs or FUSE mounts) report 0 instead of failing
+        supported = copied or not os.fstat(source.fileno()).st_size
+    except (AttributeError, OSError):
+        # Not supported here (e.g. non-Linux or cross-filesystem on old kernels)
+        supported = False
+    if not supported:
+        source.seek(0)
+        destination.seek(0)
+        destination.truncate()
+        shutil.copyfileobj(source, destination, length=COPY_BUFFER_SIZE)
+
+
 def atomic_copy(source: Path, destination: Path) -> None:
     """
     Atomically copy a file to destination.
@@ -59,16 +203,17 @@ def atomic_copy(source: Path, destination: Path) -> None:
     destination = Path(destination)
     destination.parent.mkdir(parents=True, exist_ok=True)
     
-    # Copy to temporary file first
-    temp_file = destination.parent / f".{destination.name}.tmp"
+    # Copy to a uniquely named temporary file first
+    temp_file = new_temp_file(destination)
     
     try:
-        shutil.copy2(source, temp_file)
+        with open(source, "rb") as src, open(temp_file, "wb") as dst:
+            _copy_file_contents(src, dst)
+        shutil.copystat(source, temp_file)
         # Atomic rename
         temp_file.replace(destination)
     except Exception:
         # Clean up temp file on error
-        if temp_file.exists():
-            temp_file.unlink()
+        temp_file.unlink(missing_ok=True)
         raise
 
@@ -0,0 +1,10 @@
+"""Shared pytest fixtures."""
+import pytest
+import responses
+
+
+@pytest.fixture
+def http():
+    """Intercept the session's requests at the transport adapter; unmatched requests fail."""
+    with responses.RequestsMock() as rsps:
+        yield rsps
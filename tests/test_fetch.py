@@ -1,277 +1,414 @@
 """Tests for gh_archive.jobs.fetch module."""
-import tempfile
+import gzip
+import io
+import re
+import threading
 from pathlib import Path
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import patch
 
 import pytest
 import requests
+import responses
+from responses import matchers
+from urllib3.exceptions import ProtocolError
 
-from gh_archive.jobs.fetch import download_file
+from gh_archive.jobs.fetch import DOWNLOAD_CHUNK_SIZE, download_file, download_files, get_session
+
+URL = "https://example.com/test.json.gz"
+
+
+class FailingRaw(io.RawIOBase):
+    """Socket stand-in that delivers `size` bytes per read, then breaks."""
+
+    def __init__(self, content: bytes, size: int):
+        self.stream = io.BytesIO(content)
+        self.size = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.stream.tell():
+            raise OSError("Connection reset")
+        data = self.stream.read(min(len(buffer), self.size))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def failing_body(content: bytes, size: int) -> io.BufferedReader:
+    """Response body whose connection drops after the first `size` bytes."""
+    return io.BufferedReader(FailingRaw(content, size))
 
 
 class TestDownloadFile:
     """Test cases for download_file function."""
 
-    def test_successful_download(self, tmp_path):
-        """Test successful file download."""
-        url = "https://example.com/test.json.gz"
+    @pytest.mark.parametrize(
+        "content",
+        [b"chunk1chunk2chunk3", b"", b"\x1f\x8b compressed bytes"],
+        ids=["chunks", "empty", "gzip-bytes"],
+    )
+    def test_successful_download(self, tmp_path, http, content):
+        """Test that the raw response bytes are saved as-is."""
         output_path = tmp_path / "test.json.gz"
+        http.get(URL, body=content)
+        
+        result = download_file(URL, str(output_path))
         
-        # Mock successful HTTP response
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        mock_response.iter_content.return_value = [b"chunk1", b"chunk2", b"chunk3"]
+        assert result == str(output_path)
+        assert output_path.read_bytes() == content
+        assert len(http.calls) == 1
+
+    def test_does_not_decode_content_encoding(self, tmp_path, http):
+        """Test that a gzip Content-Encoding is written compressed, not decoded."""
+        output_path = tmp_path / "test.json.gz"
+        compressed = gzip.compress(b'{"id": "1"}\n')
+        http.get(URL, body=compressed, headers={"Content-Encoding": "gzip"})
         
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            result = download_file(url, str(output_path))
+        download_file(URL, str(output_path))
         
+        assert output_path.read_bytes() == compressed
+
+    @pytest.mark.parametrize("path_type", [str, Path])
+    def test_returns_string_path(self, tmp_path, http, path_type):
+        """Test that str and Path inputs are accepted and a string path is returned."""
+        output_path = tmp_path / "test.json.gz"
+        http.get(URL, body=b"content")
+        
+        result = download_file(URL, path_type(output_path))
+        
+        assert isinstance(result, str)
         assert result == str(output_path)
         assert output_path.exists()
-        assert output_path.read_bytes() == b"chunk1chunk2chunk3"
-        mock_response.raise_for_status.assert_called_once()
 
-    def test_file_already_exists_no_overwrite(self, tmp_path):
+    def test_file_already_exists_no_overwrite(self, tmp_path, http):
         """Test that existing file is skipped when overwrite=False."""
-        url = "https://example.com/test.json.gz"
         output_path = tmp_path / "test.json.gz"
         output_path.write_text("existing content")
+        http.head(URL, headers={"Content-Length": str(len("existing content"))})
+        
+        result = download_file(URL, str(output_path), overwrite=False)
+        
+        assert result == str(output_path)
+        assert output_path.read_text() == "existing content"
+        assert [call.request.method for call in http.calls] == ["HEAD"]
+
+    def test_redownloads_truncated_existing_file(self, tmp_path, http):
+        """Test that an existing file shorter than Content-Length is downloaded again."""
+        output_path = tmp_path / "test.json.gz"
+        output_path.write_bytes(b"part")
+        http.head(URL, headers={"Content-Length": "12"})
+        http.get(URL, body=b"full content")
+        
+        download_file(URL, str(output_path))
+        
+        assert output_path.read_bytes() == b"full content"
+
+    def test_redownloads_when_etag_changed(self, tmp_path, http):
+        """Test that a changed remote ETag triggers a new download and updates the sidecar."""
+        output_path = tmp_path / "test.json.gz"
+        output_path.write_bytes(b"old content")
+        etag_path = tmp_path / "test.json.gz.etag"
+        etag_path.write_text('"v1"')
+        http.head(URL, headers={"ETag": '"v2"', "Content-Length": "11"})
+        http.get(URL, body=b"new content", headers={"ETag": '"v2"'})
+        
+        download_file(URL, str(output_path))
+        
+        assert output_path.read_bytes() == b"new content"
+        assert etag_path.read_text() == '"v2"'
+
+    def test_keeps_existing_file_when_head_fails(self, tmp_path, http):
+        """Test that an existing file is kept if it cannot be verified."""
+        output_path = tmp_path / "test.json.gz"
+        output_path.write_text("existing content")
+        http.head(URL, body=requests.ConnectionError("offline"))
         
-        with patch("gh_archive.jobs.fetch.requests.get") as mock_get:
-            result = download_file(url, str(output_path), overwrite=False)
+        result = download_file(URL, str(output_path))
         
         assert result == str(output_path)
         assert output_path.read_text() == "existing content"
-        mock_get.assert_not_called()
+        assert [call.request.method for call in http.calls] == ["HEAD"]
+
+    def test_resumes_partial_download(self, tmp_path, http):
+        """Test that resume=True continues a partial temp file with a Range request."""
+        output_path = tmp_path / "test.json.gz"
+        (tmp_path / ".test.json.gz.tmp").write_bytes(b"first ")
+        (tmp_path / ".test.json.gz.tmp.etag").write_text('"v1"')
+        http.get(
+            URL,
+            body=b"second",
+            status=206,
+            headers={"ETag": '"v1"'},
+            match=[matchers.header_matcher({"Range": "bytes=6-", "If-Range": '"v1"'})],
+        )
+        
+        download_file(URL, str(output_path), resume=True)
+        
+        assert output_path.read_bytes() == b"first second"
+        assert not (tmp_path / ".test.json.gz.tmp").exists()
+        assert not (tmp_path / ".test.json.gz.tmp.etag").exists()
+
+    def test_resume_finishes_already_complete_partial_file(self, tmp_path, http):
+        """Test that a 416 for a partial file holding the whole body completes the download."""
+        output_path = tmp_path / "test.json.gz"
+        (tmp_path / ".test.json.gz.tmp").write_bytes(b"full content")
+        (tmp_path / ".test.json.gz.tmp.etag").write_text('"v1"')
+        http.get(URL, status=416, headers={"Content-Range": "bytes */12", "ETag": '"v1"'})
+        
+        download_file(URL, str(output_path), resume=True)
+        
+        assert output_path.read_bytes() == b"full content"
+        assert (tmp_path / "test.json.gz.etag").read_text() == '"v1"'
+        assert not (tmp_path / ".test.json.gz.tmp").exists()
+        assert not (tmp_path / ".test.json.gz.tmp.etag").exists()
+
+    def test_resume_restarts_when_range_no_longer_fits(self, tmp_path, http):
+        """Test that a 416 for a partial file longer than the remote file restarts the download."""
+        output_path = tmp_path / "test.json.gz"
+        (tmp_path / ".test.json.gz.tmp").write_bytes(b"old partial")
+        (tmp_path / ".test.json.gz.tmp.etag").write_text('"v1"')
+        http.get(URL, status=416, headers={"Content-Range": "bytes */3"})
+        http.get(URL, body=b"new", headers={"ETag": '"v2"'})
+        
+        download_file(URL, str(output_path), resume=True)
+        
+        assert output_path.read_bytes() == b"new"
+        assert "Range" not in http.calls[1].request.headers
+        assert (tmp_path / "test.json.gz.etag").read_text() == '"v2"'
+        assert not (tmp_path / ".test.json.gz.tmp").exists()
+
+    def test_resume_keeps_partial_file_on_error(self, tmp_path, http):
+        """Test that resume=True leaves the partial download for the next attempt."""
+        output_path = tmp_path / "test.json.gz"
+        http.get(URL, body=failing_body(b"content", 4), headers={"ETag": '"v1"'})
+        
+        with pytest.raises(ProtocolError):
+            download_file(URL, str(output_path), resume=True, chunk_size=4)
+        
+        assert (tmp_path / ".test.json.gz.tmp").read_bytes() == b"cont"
+        assert (tmp_path / ".test.json.gz.tmp.etag").read_text() == '"v1"'
+        assert not output_path.exists()
 
-    def test_file_already_exists_with_overwrite(self, tmp_path):
+    def test_file_already_exists_with_overwrite(self, tmp_path, http):
         """Test that existing file is overwritten when overwrite=True."""
-        url = "https://example.com/test.json.gz"
         output_path = tmp_path / "test.json.gz"
         output_path.write_text("old content")
+        http.get(URL, body=b"new content")
         
-        # Mock successful HTTP response
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        mock_response.iter_content.return_value = [b"new content"]
-        
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            result = download_file(url, str(output_path), overwrite=True)
+        result = download_file(URL, str(output_path), overwrite=True)
         
         assert result == str(output_path)
         assert output_path.read_bytes() == b"new content"
 
-    def test_creates_parent_directories(self, tmp_path):
+    def test_creates_parent_directories(self, tmp_path, http):
         """Test that parent directories are created if they don't exist."""
-        url = "https://example.com/test.json.gz"
         output_path = tmp_path / "nested" / "deep" / "path" / "test.json.gz"
+        http.get(URL, body=b"content")
         
-        # Mock successful HTTP response
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        mock_response.iter_content.return_value = [b"content"]
-        
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            result = download_file(url, str(output_path))
+        result = download_file(URL, str(output_path))
         
         assert result == str(output_path)
         assert output_path.exists()
         assert output_path.parent.exists()
 
-    def test_http_error_raises_exception(self, tmp_path):
-        """Test that HTTP errors are raised."""
-        url = "https://example.com/test.json.gz"
-        output_path = tmp_path / "test.json.gz"
-        
-        # Mock HTTP error response
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status.side_effect = requests.HTTPError("404 Not Found")
-        
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            with pytest.raises(requests.HTTPError):
-                download_file(url, str(output_path))
-        
-        # Temp file should be cleaned up
-        tmp_file = output_path.parent / f".{output_path.name}.tmp"
-        assert not tmp_file.exists()
-        assert not output_path.exists()
+    def test_creates_parent_directory_once(self, tmp_path, http):
+        """Test that repeated downloads into one directory only create it once."""
+        output_dir = tmp_path / "nested" / "dir"
+        http.get(re.compile(r"https://example\.com/\w\.json\.gz"), body=b"content")
+        
+        with patch.object(Path, "mkdir", autospec=True, side_effect=Path.mkdir) as mock_mkdir:
+            download_file("https://example.com/a.json.gz", output_dir / "a.json.gz")
+            assert mock_mkdir.called
+            mock_mkdir.reset_mock()
+            download_file("https://example.com/b.json.gz", output_dir / "b.json.gz")
+        
+        mock_mkdir.assert_not_called()
+        assert (output_dir / "b.json.gz").read_bytes() == b"content"
 
-    def test_connection_error_raises_exception(self, tmp_path):
-        """Test that connection errors are raised."""
-        url = "https://example.com/test.json.gz"
+    def test_http_error_raises_exception(self, tmp_path, http):
+        """Test that HTTP errors are raised."""
         output_path = tmp_path / "test.json.gz"
+        http.get(URL, status=404)
         
-        with patch("gh_archive.jobs.fetch.requests.get", side_effect=requests.ConnectionError("Connection failed")):
-            with pytest.raises(requests.ConnectionError):
-                download_file(url, str(output_path))
+        with pytest.raises(requests.HTTPError):
+            download_file(URL, str(output_path))
         
         # Temp file should be cleaned up
         tmp_file = output_path.parent / f".{output_path.name}.tmp"
         assert not tmp_file.exists()
         assert not output_path.exists()
 
-    def test_timeout_error_raises_exception(self, tmp_path):
-        """Test that timeout errors are raised."""
-        url = "https://example.com/test.json.gz"
+    @pytest.mark.parametrize(
+        "error",
+        [requests.ConnectionError("Connection failed"), requests.Timeout("Request timeout")],
+        ids=["connection", "timeout"],
+    )
+    def test_request_error_raises_exception(self, tmp_path, http, error):
+        """Test that connection and timeout errors are raised."""
         output_path = tmp_path / "test.json.gz"
+        http.get(URL, body=error)
         
-        with patch("gh_archive.jobs.fetch.requests.get", side_effect=requests.Timeout("Request timeout")):
-            with pytest.raises(requests.Timeout):
-                download_file(url, str(output_path))
+        with pytest.raises(type(error)):
+            download_file(URL, str(output_path))
         
         # Temp file should be cleaned up
         tmp_file = output_path.parent / f".{output_path.name}.tmp"
         assert not tmp_file.exists()
         assert not output_path.exists()
 
-    def test_atomic_write_using_temp_file(self, tmp_path):
+    def test_atomic_write_using_temp_file(self, tmp_path, http):
         """Test that file is written atomically via temp file."""
-        url = "https://example.com/test.json.gz"
         output_path = tmp_path / "test.json.gz"
+        http.get(URL, body=b"content")
         
-        # Mock successful HTTP response
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        mock_response.iter_content.return_value = [b"content"]
-        
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            download_file(url, str(output_path))
+        download_file(URL, str(output_path))
         
         # Verify temp file doesn't exist after successful download
         tmp_file = output_path.parent / f".{output_path.name}.tmp"
         assert not tmp_file.exists()
         assert output_path.exists()
 
-    def test_large_file_chunked_download(self, tmp_path):
+    @pytest.mark.parametrize("durable", [True, False])
+    def test_fsyncs_file_and_directory_when_durable(self, tmp_path, http, durable):
+        """Test that durable=True syncs the data and the rename, and durable=False skips both."""
+        output_path = tmp_path / "test.json.gz"
+        http.get(URL, body=b"content")
+        
+        with patch("gh_archive.jobs.fetch.os.fsync") as mock_fsync, \
+                patch("gh_archive.jobs.fetch.fsync_dir") as mock_fsync_dir:
+            download_file(URL, str(output_path), durable=durable)
+        
+        assert output_path.read_bytes() == b"content"
+        assert mock_fsync.call_count == int(durable)
+        if durable:
+            mock_fsync_dir.assert_called_once_with(tmp_path)
+        else:
+            mock_fsync_dir.assert_not_called()
+
+    @pytest.mark.parametrize("chunk_size", [64 * 1024, DOWNLOAD_CHUNK_SIZE])
+    def test_large_file_chunked_download(self, tmp_path, http, chunk_size):
         """Test that large files are downloaded in chunks."""
         url = "https://example.com/large.json.gz"
         output_path = tmp_path / "large.json.gz"
         
         # Create large content (simulate 5MB file)
-        large_chunks = [b"x" * (1024 * 1024)] * 5  # 5 chunks of 1MB each
-        
-        # Mock successful HTTP response
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        mock_response.iter_content.return_value = large_chunks
+        large_content = b"x" * (5 * 1024 * 1024)
+        http.get(url, body=large_content)
         
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            result = download_file(url, str(output_path))
+        result = download_file(url, str(output_path), chunk_size=chunk_size)
         
         assert result == str(output_path)
         assert output_path.exists()
         assert len(output_path.read_bytes()) == 5 * 1024 * 1024
 
-    def test_empty_file_download(self, tmp_path):
-        """Test downloading an empty file."""
-        url = "https://example.com/empty.json.gz"
-        output_path = tmp_path / "empty.json.gz"
-        
-        # Mock successful HTTP response with no content
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        mock_response.iter_content.return_value = []
+    def test_custom_chunk_size(self, tmp_path, http):
+        """Test that chunk_size is used as the copy buffer length."""
+        output_path = tmp_path / "test.json.gz"
+        http.get(URL, body=b"content")
         
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            result = download_file(url, str(output_path))
+        with patch("gh_archive.jobs.fetch.shutil.copyfileobj") as mock_copy:
+            download_file(URL, str(output_path), chunk_size=64 * 1024)
         
-        assert result == str(output_path)
-        assert output_path.exists()
-        assert len(output_path.read_bytes()) == 0
+        mock_copy.assert_called_once()
+        assert mock_copy.call_args.kwargs["length"] == 64 * 1024
 
-    def test_skips_empty_chunks(self, tmp_path):
-        """Test that empty chunks are skipped during download."""
-        url = "https://example.com/test.json.gz"
+    def test_preallocates_content_length(self, tmp_path, http):
+        """Test that the temp file is preallocated to Content-Length."""
         output_path = tmp_path / "test.json.gz"
+        content = b"x" * 4096
+        http.get(URL, body=content, headers={"Content-Length": str(len(content))})
         
-        # Mock response with some empty chunks
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        mock_response.iter_content.return_value = [b"chunk1", b"", b"chunk2", b"", b"chunk3"]
-        
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            result = download_file(url, str(output_path))
+        with patch("gh_archive.jobs.fetch.os.posix_fallocate", create=True) as mock_fallocate:
+            download_file(URL, str(output_path))
         
-        assert result == str(output_path)
-        assert output_path.read_bytes() == b"chunk1chunk2chunk3"
+        mock_fallocate.assert_called_once()
+        assert mock_fallocate.call_args.args[1:] == (0, 4096)
+        assert output_path.read_bytes() == content
 
-    def test_temp_file_cleanup_on_write_error(self, tmp_path):
-        """Test that temp file is cleaned up if write fails."""
-        url = "https://example.com/test.json.gz"
+    @pytest.mark.parametrize("chunk_size", [1024, DOWNLOAD_CHUNK_SIZE])
+    def test_temp_file_cleanup_on_write_error(self, tmp_path, http, chunk_size):
+        """Test that temp file is cleaned up if the connection drops mid-download."""
         output_path = tmp_path / "test.json.gz"
+        http.get(URL, body=failing_body(b"chunk1" * 100, chunk_size))
         
-        # Mock response that raises error during write
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        
-        # Simulate write error
-        def failing_iter_content(chunk_size):
-            yield b"chunk1"
-            raise IOError("Disk full")
-        
-        mock_response.iter_content.return_value = failing_iter_content(1024 * 1024)
-        
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            with pytest.raises(IOError):
-                download_file(url, str(output_path))
+        with pytest.raises(ProtocolError):
+            download_file(URL, str(output_path), chunk_size=chunk_size)
         
         # Temp file should be cleaned up
         tmp_file = output_path.parent / f".{output_path.name}.tmp"
         assert not tmp_file.exists()
         assert not output_path.exists()
 
-    def test_returns_string_path(self, tmp_path):
-        """Test that function returns string path, not Path object."""
-        url = "https://example.com/test.json.gz"
-        output_path = tmp_path / "test.json.gz"
-        
-        # Mock successful HTTP response
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        mock_response.iter_content.return_value = [b"content"]
-        
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            result = download_file(url, str(output_path))
-        
-        assert isinstance(result, str)
-        assert result == str(output_path)
 
-    def test_handles_path_object_input(self, tmp_path):
-        """Test that function accepts Path object as input."""
-        url = "https://example.com/test.json.gz"
-        output_path = tmp_path / "test.json.gz"
-        
-        # Mock successful HTTP response
-        mock_response = MagicMock()
-        mock_response.__enter__ = Mock(return_value=mock_response)
-        mock_response.__exit__ = Mock(return_value=None)
-        mock_response.raise_for_status = Mock()
-        mock_response.iter_content.return_value = [b"content"]
-        
-        with patch("gh_archive.jobs.fetch.requests.get", return_value=mock_response):
-            # Pass Path object instead of string
-            result = download_file(url, output_path)
-        
-        assert isinstance(result, str)
-        assert result == str(output_path)
-        assert output_path.exists()
+class TestSession:
+    """Test cases for the shared download session."""
+
+    def test_reuses_one_session_with_retries(self, tmp_path, http):
+        """Test that downloads share a pooled session that retries transient errors."""
+        session = get_session()
+        assert get_session() is session
+        adapter = session.get_adapter("https://data.gharchive.org/2024-01-01-15.json.gz")
+        assert adapter.max_retries.total == 5
+        assert 503 in adapter.max_retries.status_forcelist
+        
+        http.get(re.compile(r"https://example\.com/\w\.json\.gz"), body=b"content")
+        
+        with patch.object(session, "send", wraps=session.send) as mock_send:
+            download_file("https://example.com/a.json.gz", tmp_path / "a.json.gz")
+            download_file("https://example.com/b.json.gz", tmp_path / "b.json.gz")
+        
+        assert mock_send.call_count == 2
+        assert len(http.calls) == 2
 
+
+class TestDownloadFiles:
+    """Test cases for download_files function."""
+
+    def test_downloads_all_files(self, tmp_path, http):
+        """Test that every (url, path) pair is downloaded."""
+        pairs = [(f"https://example.com/{i}.json.gz", tmp_path / f"{i}.json.gz") for i in range(5)]
+        http.add_callback(
+            responses.GET,
+            re.compile(r"https://example\.com/\d+\.json\.gz"),
+            callback=lambda request: (200, {}, request.url.encode()),
+        )
+        
+        results = list(download_files(pairs, max_concurrency=2))
+        
+        assert sorted(results) == sorted(str(path) for _, path in pairs)
+        for url, path in pairs:
+            assert path.read_bytes() == url.encode()
+
+    def test_runs_downloads_concurrently_up_to_limit(self, tmp_path, http):
+        """Test that max_concurrency requests are in flight at once, and no more."""
+        pairs = [(f"https://example.com/{i}.json.gz", tmp_path / f"{i}.json.gz") for i in range(6)]
+        # Every request waits until 3 are in flight; fails if they were sequential
+        barrier = threading.Barrier(3, timeout=5)
+        lock = threading.Lock()
+        active = [0]
+        peak = [0]
+        
+        def respond(request):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            barrier.wait()
+            with lock:
+                active[0] -= 1
+            return 200, {}, b"content"
+        
+        http.add_callback(responses.GET, re.compile(r"https://example\.com/\d+\.json\.gz"), callback=respond)
+        
+        results = list(download_files(pairs, max_concurrency=3))
+        
+        assert len(results) == 6
+        assert peak[0] == 3
+
+    def test_propagates_download_errors(self, tmp_path, http):
+        """Test that a failed download raises from the iterator."""
+        pairs = [("https://example.com/missing.json.gz", tmp_path / "missing.json.gz")]
+        http.get(pairs[0][0], body=requests.ConnectionError("boom"))
+        
+        with pytest.raises(requests.ConnectionError):
+            list(download_files(pairs))
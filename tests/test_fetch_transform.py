@@ -0,0 +1,89 @@
+"""Tests for gh_archive.jobs.fetch_transform module."""
+import gzip
+import json
+
+import pandas as pd
+import pytest
+import requests
+
+from gh_archive.jobs.fetch_transform import fetch_and_transform
+
+
+def _gz_events(events: list[dict]) -> bytes:
+    """Helper to build gzip-compressed NDJSON bytes."""
+    return gzip.compress("".join(json.dumps(event) + "\n" for event in events).encode("utf-8"))
+
+
+class TestFetchAndTransform:
+    """Test cases for fetch_and_transform function."""
+
+    EVENTS = [
+        {"id": "1", "type": "PushEvent", "actor": {"login": "alice"}, "payload": {"size": 2}},
+        {"id": "2", "type": "IssuesEvent", "actor": {"login": "bob"}, "payload": {"action": "opened"}},
+    ]
+
+    def test_streams_to_parquet_without_raw_file(self, tmp_path, http):
+        """Test that the download is transformed without landing the raw file."""
+        url = "https://example.com/test.json.gz"
+        output_parquet = tmp_path / "clean" / "events.parquet"
+        http.get(url, body=_gz_events(self.EVENTS))
+
+        result = fetch_and_transform(url, output_parquet)
+
+        assert result == str(output_parquet)
+        df = pd.read_parquet(output_parquet)
+        assert df["actor_login"].tolist() == ["alice", "bob"]
+        assert list(tmp_path.rglob("*.json.gz")) == []
+
+    def test_keeps_raw_copy(self, tmp_path, http):
+        """Test that the raw bytes are tee'd to raw_path when requested."""
+        url = "https://example.com/test.json.gz"
+        output_parquet = tmp_path / "clean" / "events.parquet"
+        raw_path = tmp_path / "raw" / "events.json.gz"
+        content = _gz_events(self.EVENTS)
+        http.get(url, body=content)
+
+        fetch_and_transform(url, output_parquet, raw_path=raw_path)
+
+        assert raw_path.read_bytes() == content
+        assert len(pd.read_parquet(output_parquet)) == 2
+        assert list(tmp_path.rglob("*.tmp")) == []
+
+    def test_reuses_existing_raw_file(self, tmp_path, http):
+        """Test that an existing raw file is transformed instead of downloaded."""
+        url = "https://example.com/test.json.gz"
+        output_parquet = tmp_path / "clean" / "events.parquet"
+        raw_path = tmp_path / "raw" / "events.json.gz"
+        raw_path.parent.mkdir(parents=True)
+        raw_path.write_bytes(_gz_events(self.EVENTS))
+
+        fetch_and_transform(url, output_parquet, raw_path=raw_path)
+
+        assert len(http.calls) == 0
+        assert len(pd.read_parquet(output_parquet)) == 2
+
+    def test_file_already_exists_no_overwrite(self, tmp_path, http):
+        """Test that an existing Parquet file is skipped when overwrite=False."""
+        url = "https://example.com/test.json.gz"
+        output_parquet = tmp_path / "events.parquet"
+        output_parquet.write_bytes(b"existing")
+
+        result = fetch_and_transform(url, output_parquet)
+
+        assert result == str(output_parquet)
+        assert output_parquet.read_bytes() == b"existing"
+        assert len(http.calls) == 0
+
+    def test_cleans_up_temp_files_on_http_error(self, tmp_path, http):
+        """Test that temp files are removed when the download fails."""
+        url = "https://example.com/test.json.gz"
+        output_parquet = tmp_path / "clean" / "events.parquet"
+        raw_path = tmp_path / "raw" / "events.json.gz"
+        http.get(url, status=404)
+
+        with pytest.raises(requests.HTTPError):
+            fetch_and_transform(url, output_parquet, raw_path=raw_path)
+
+        assert list(tmp_path.rglob("*.tmp")) == []
+        assert not output_parquet.exists()
+        assert not raw_path.exists()
@@ -0,0 +1,126 @@
+"""Tests for gh_archive.utils.io module."""
+import io
+import os
+import shutil
+from unittest.mock import patch
+
+import pytest
+
+from gh_archive.utils.io import atomic_copy, atomic_write_binary
+
+
+class TestAtomicWriteBinary:
+    """Tests for atomic_write_binary function."""
+
+    @pytest.mark.parametrize(
+        "content",
+        [
+            b"hello world",
+            [b"hello", b" ", b"world"],
+            io.BytesIO(b"hello world"),
+        ],
+        ids=["bytes", "iterable", "file"],
+    )
+    def test_writes_each_content_kind(self, tmp_path, content):
+        """Test that bytes, an iterable of chunks and a file-like object are all written."""
+        output = tmp_path / "out" / "data.bin"
+        
+        atomic_write_binary(output, content)
+        
+        assert output.read_bytes() == b"hello world"
+        assert list(output.parent.glob("*.tmp")) == []
+
+    def test_retries_short_writes(self, tmp_path):
+        """Test that a write accepting only part of the data is retried with the rest."""
+        output = tmp_path / "data.bin"
+        real_write = os.write
+        
+        def short_write(fd, data):
+            return real_write(fd, bytes(data[:3]))
+        
+        with patch("gh_archive.utils.io.os.write", side_effect=short_write) as mock_write:
+            atomic_write_binary(output, b"hello world")
+        
+        assert output.read_bytes() == b"hello world"
+        assert mock_write.call_count == 4
+
+    def test_recreates_removed_directory(self, tmp_path):
+        """Test that a directory removed after an earlier write is created again."""
+        output = tmp_path / "out" / "data.bin"
+        atomic_write_binary(output, b"first")
+        shutil.rmtree(output.parent)
+        
+        atomic_write_binary(output, b"second")
+        
+        assert output.read_bytes() == b"second"
+
+    def test_concurrent_writes_use_separate_temp_files(self, tmp_path):
+        """Test that a write to the same target while another is in progress does not collide."""
+        output = tmp_path / "data.bin"
+        
+        def chunks():
+            yield b"outer "
+            atomic_write_binary(output, b"inner")
+            yield b"write"
+        
+        atomic_write_binary(output, chunks())
+        
+        assert output.read_bytes() == b"outer write"
+        assert list(tmp_path.glob("*.tmp")) == []
+
+    def test_cleans_up_temp_file_on_error(self, tmp_path):
+        """Test that a failed write leaves neither the target nor a temp file."""
+        output = tmp_path / "data.bin"
+        
+        def chunks():
+            yield b"partial"
+            raise RuntimeError("boom")
+        
+        with pytest.raises(RuntimeError):
+            atomic_write_binary(output, chunks())
+        
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestAtomicCopy:
+    """Tests for atomic_copy function."""
+
+    def test_copies_file(self, tmp_path):
+        """Test that the destination gets the source's contents."""
+        source = tmp_path / "source.bin"
+        source.write_bytes(b"x" * 5000)
+        destination = tmp_path / "out" / "dest.bin"
+        
+        atomic_copy(source, destination)
+        
+        assert destination.read_bytes() == b"x" * 5000
+        assert list(destination.parent.glob("*.tmp")) == []
+
+    @pytest.mark.parametrize(
+        "copy_file_range",
+        [
+            {"side_effect": OSError("not supported")},
+            {"return_value": 0},
+        ],
+        ids=["raises", "copies-nothing"],
+    )
+    def test_falls_back_when_copy_file_range_does_not_copy(self, tmp_path, copy_file_range):
+        """Test that the userspace copy is used when copy_file_range fails or copies nothing."""
+        source = tmp_path / "source.bin"
+        source.write_bytes(b"some data")
+        destination = tmp_path / "dest.bin"
+        
+        with patch("gh_archive.utils.io.os.copy_file_range", create=True, **copy_file_range):
+            atomic_copy(source, destination)
+        
+        assert destination.read_bytes() == b"some data"
+
+    def test_copies_empty_file(self, tmp_path):
+        """Test that an empty source gives an empty destination."""
+        source = tmp_path / "source.bin"
+        source.write_bytes(b"")
+        destination = tmp_path / "dest.bin"
+        
+        atomic_copy(source, destination)
+        
+        assert destination.read_bytes() == b""
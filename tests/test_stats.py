@@ -1,25 +1,45 @@
 """Tests for gh_archive.jobs.stats module."""
 import json
 from pathlib import Path
+from unittest.mock import patch
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
 
-from gh_archive.jobs.stats import generate_stats
+from gh_archive.jobs.stats import SOURCE_SIGNATURE_KEY, _source_signature, generate_stats
+
+# Smallest valid input, shared by tests that only need some Parquet file
+SINGLE_PUSH = [{"id": "1", "type": "PushEvent"}]
+
+
+def _create_sample_parquet(path: Path, data: list[dict]):
+    """Helper to create a sample Parquet file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df = pd.DataFrame(data)
+    df.to_parquet(path, engine="pyarrow", compression="zstd", compression_level=3, index=False)
+
+
+@pytest.fixture(scope="module")
+def sample_parquet(tmp_path_factory):
+    """Write each sample Parquet input once per module; tests must not modify it."""
+    cache = {}
+
+    def _factory(key: str, data: list[dict]) -> Path:
+        if key not in cache:
+            cache[key] = tmp_path_factory.mktemp("parquet") / f"{key}.parquet"
+            _create_sample_parquet(cache[key], data)
+        return cache[key]
+
+    return _factory
 
 
 class TestGenerateStats:
     """Test cases for generate_stats function."""
 
-    def _create_sample_parquet(self, path: Path, data: list[dict]):
-        """Helper to create a sample Parquet file."""
-        path.parent.mkdir(parents=True, exist_ok=True)
-        df = pd.DataFrame(data)
-        df.to_parquet(path, engine="pyarrow", compression="snappy", index=False)
-
-    def test_successful_stats_generation(self, tmp_path):
+    def test_successful_stats_generation(self, tmp_path, sample_parquet):
         """Test successful generation of statistics."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
         data = [
@@ -42,7 +62,7 @@ class TestGenerateStats:
                 "repo_name": "alice/repo1",
             },
         ]
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("successful_stats_generation", data)
         
         result = generate_stats(parquet_path, output_json)
         
@@ -60,9 +80,8 @@ class TestGenerateStats:
         assert stats["event_types"]["PushEvent"] == 2
         assert stats["event_types"]["IssuesEvent"] == 1
 
-    def test_file_already_exists_no_overwrite(self, tmp_path):
+    def test_file_already_exists_no_overwrite(self, tmp_path, sample_parquet):
         """Test that existing stats file is skipped when overwrite=False."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
         # Create existing stats file
@@ -71,8 +90,7 @@ class TestGenerateStats:
         with open(output_json, "w") as f:
             json.dump(existing_stats, f)
         
-        data = [{"id": "1", "type": "PushEvent"}]
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("single_push", SINGLE_PUSH)
         
         result = generate_stats(parquet_path, output_json, overwrite=False)
         
@@ -82,10 +100,58 @@ class TestGenerateStats:
             stats = json.load(f)
         assert stats["total_events"] == 999
 
-    def test_file_already_exists_with_overwrite(self, tmp_path):
-        """Test that existing stats file is overwritten when overwrite=True."""
+    def test_regenerates_when_parquet_changed(self, tmp_path):
+        """Test that stats built from an older Parquet file are regenerated."""
+        parquet_path = tmp_path / "input.parquet"
+        output_json = tmp_path / "stats.json"
+        
+        _create_sample_parquet(parquet_path, SINGLE_PUSH)
+        generate_stats(parquet_path, output_json)
+        
+        # Rewrite the input, then run again without overwrite
+        _create_sample_parquet(parquet_path, [{"id": "1", "type": "PushEvent"}, {"id": "2", "type": "PushEvent"}])
+        generate_stats(parquet_path, output_json)
+        
+        with open(output_json) as f:
+            stats = json.load(f)
+        assert stats["total_events"] == 2
+
+    @pytest.mark.parametrize("initial", ["missing", "corrupt"])
+    def test_retries_error_result_once_parquet_is_valid(self, tmp_path, initial):
+        """Test that an error result is replaced once a valid Parquet file exists."""
         parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
+        if initial == "corrupt":
+            parquet_path.write_bytes(b"invalid parquet content")
+        
+        generate_stats(parquet_path, output_json)
+        with open(output_json) as f:
+            assert "error" in json.load(f)
+        
+        _create_sample_parquet(parquet_path, SINGLE_PUSH)
+        generate_stats(parquet_path, output_json)
+        
+        with open(output_json) as f:
+            stats = json.load(f)
+        assert "error" not in stats
+        assert stats["total_events"] == 1
+
+    def test_skips_when_parquet_unchanged(self, tmp_path):
+        """Test that stats are not rebuilt while the Parquet file is unchanged."""
+        parquet_path = tmp_path / "input.parquet"
+        output_json = tmp_path / "stats.json"
+        
+        _create_sample_parquet(parquet_path, SINGLE_PUSH)
+        generate_stats(parquet_path, output_json)
+        
+        with patch("gh_archive.jobs.stats._count_by_value") as mock_count:
+            generate_stats(parquet_path, output_json)
+        
+        mock_count.assert_not_called()
+
+    def test_file_already_exists_with_overwrite(self, tmp_path, sample_parquet):
+        """Test that existing stats file is overwritten when overwrite=True."""
+        output_json = tmp_path / "stats.json"
         
         # Create existing stats file
         existing_stats = {"total_events": 999}
@@ -93,8 +159,7 @@ class TestGenerateStats:
         with open(output_json, "w") as f:
             json.dump(existing_stats, f)
         
-        data = [{"id": "1", "type": "PushEvent"}]
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("single_push", SINGLE_PUSH)
         
         result = generate_stats(parquet_path, output_json, overwrite=True)
         
@@ -104,13 +169,11 @@ class TestGenerateStats:
             stats = json.load(f)
         assert stats["total_events"] == 1
 
-    def test_creates_parent_directories(self, tmp_path):
+    def test_creates_parent_directories(self, tmp_path, sample_parquet):
         """Test that parent directories are created if they don't exist."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "nested" / "deep" / "path" / "stats.json"
         
-        data = [{"id": "1", "type": "PushEvent"}]
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("single_push", SINGLE_PUSH)
         
         result = generate_stats(parquet_path, output_json)
         
@@ -153,9 +216,8 @@ class TestGenerateStats:
         
         assert stats["total_events"] == 0
 
-    def test_generates_top_event_types(self, tmp_path):
+    def test_generates_top_event_types(self, tmp_path, sample_parquet):
         """Test that top event types are included in stats."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
         # Create data with multiple event types
@@ -167,7 +229,7 @@ class TestGenerateStats:
         for i in range(5):
             data.append({"id": str(i + 25), "type": "PullRequestEvent"})
         
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("generates_top_event_types", data)
         
         generate_stats(parquet_path, output_json)
         
@@ -180,16 +242,15 @@ class TestGenerateStats:
         # Should only include top 10
         assert len(stats["top_event_types"]) <= 10
 
-    def test_generates_top_repos(self, tmp_path):
+    def test_generates_top_repos(self, tmp_path, sample_parquet):
         """Test that top repositories are included in stats."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
         data = []
         for i in range(20):
             data.append({"id": str(i), "type": "PushEvent", "repo_name": f"repo{i % 5}"})
         
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("generates_top_repos", data)
         
         generate_stats(parquet_path, output_json)
         
@@ -199,16 +260,34 @@ class TestGenerateStats:
         assert "top_repos" in stats
         assert len(stats["top_repos"]) <= 10
 
-    def test_generates_top_actors(self, tmp_path):
+    def test_top_repos_limited_to_most_frequent(self, tmp_path, sample_parquet):
+        """Test that only the 10 most frequent repos are kept, ties in first-seen order."""
+        output_json = tmp_path / "stats.json"
+        
+        # repo0..repo4 appear 3 times, repo5..repo19 once
+        names = [f"repo{i}" for i in range(20)] + [f"repo{i}" for i in range(5)] * 2
+        data = [{"id": str(i), "type": "PushEvent", "repo_name": name} for i, name in enumerate(names)]
+        parquet_path = sample_parquet("top_repos_limited_to_most_frequent", data)
+        
+        generate_stats(parquet_path, output_json)
+        
+        with open(output_json) as f:
+            stats = json.load(f)
+        
+        assert list(stats["top_repos"].items()) == (
+            [(f"repo{i}", 3) for i in range(5)] + [(f"repo{i}", 1) for i in range(5, 10)]
+        )
+        assert stats["unique_repos"] == 20
+
+    def test_generates_top_actors(self, tmp_path, sample_parquet):
         """Test that top actors are included in stats."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
         data = []
         for i in range(20):
             data.append({"id": str(i), "type": "PushEvent", "actor_login": f"user{i % 5}"})
         
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("generates_top_actors", data)
         
         generate_stats(parquet_path, output_json)
         
@@ -218,14 +297,36 @@ class TestGenerateStats:
         assert "top_actors" in stats
         assert len(stats["top_actors"]) <= 10
 
-    def test_handles_missing_columns(self, tmp_path):
-        """Test handling of missing optional columns."""
+    def test_merges_counts_across_batches(self, tmp_path):
+        """Test that counts streamed in many small batches match a single pass."""
         parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
+        types = ["PushEvent", "IssuesEvent", "PushEvent", "WatchEvent", None, "PushEvent", "IssuesEvent"]
+        actors = ["alice", "bob", "alice", "carol", "alice", "bob", None]
+        table = pa.table({
+            "type": pa.array(types).dictionary_encode(),
+            "actor_login": actors,
+        })
+        pq.write_table(table, parquet_path, row_group_size=3)
+        
+        with patch("gh_archive.jobs.stats.STATS_BATCH_SIZE", 2):
+            generate_stats(parquet_path, output_json)
+        
+        with open(output_json) as f:
+            stats = json.load(f)
+        
+        assert stats["total_events"] == 7
+        assert stats["event_types"] == {"PushEvent": 3, "IssuesEvent": 2, "WatchEvent": 1}
+        assert stats["unique_actors"] == 3
+        assert stats["top_actors"] == {"alice": 3, "bob": 2, "carol": 1}
+
+    def test_handles_missing_columns(self, tmp_path, sample_parquet):
+        """Test handling of missing optional columns."""
+        output_json = tmp_path / "stats.json"
+        
         # Create parquet with minimal columns
-        data = [{"id": "1", "type": "PushEvent"}]
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("single_push", SINGLE_PUSH)
         
         result = generate_stats(parquet_path, output_json)
         
@@ -237,13 +338,25 @@ class TestGenerateStats:
         assert stats["unique_actors"] == 0  # actor_login column missing
         assert stats["unique_repos"] == 0  # repo_name column missing
 
-    def test_handles_path_objects(self, tmp_path):
+    def test_reads_only_stats_columns(self, tmp_path, sample_parquet):
+        """Test that only the columns the stats need are read from Parquet."""
+        output_json = tmp_path / "stats.json"
+        
+        data = [{"id": "1", "type": "PushEvent", "actor_login": "alice", "repo_url": "https://example.com"}]
+        parquet_path = sample_parquet("reads_only_stats_columns", data)
+        
+        with patch.object(
+            pq.ParquetFile, "iter_batches", autospec=True, side_effect=pq.ParquetFile.iter_batches
+        ) as mock_iter_batches:
+            generate_stats(parquet_path, output_json)
+        
+        assert mock_iter_batches.call_args.kwargs["columns"] == ["type", "actor_login"]
+
+    def test_handles_path_objects(self, tmp_path, sample_parquet):
         """Test that function accepts Path objects."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
-        data = [{"id": "1", "type": "PushEvent"}]
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("single_push", SINGLE_PUSH)
         
         # Pass Path objects instead of strings
         result = generate_stats(parquet_path, output_json)
@@ -251,13 +364,11 @@ class TestGenerateStats:
         assert isinstance(result, str)
         assert output_json.exists()
 
-    def test_handles_string_paths(self, tmp_path):
+    def test_handles_string_paths(self, tmp_path, sample_parquet):
         """Test that function accepts string paths."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
-        data = [{"id": "1", "type": "PushEvent"}]
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("single_push", SINGLE_PUSH)
         
         # Pass string paths
         result = generate_stats(str(parquet_path), str(output_json))
@@ -285,29 +396,26 @@ class TestGenerateStats:
         assert stats["total_events"] == 0
         assert "error" in stats
 
-    def test_returns_string_path(self, tmp_path):
+    def test_returns_string_path(self, tmp_path, sample_parquet):
         """Test that function returns string path, not Path object."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
-        data = [{"id": "1", "type": "PushEvent"}]
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("single_push", SINGLE_PUSH)
         
         result = generate_stats(parquet_path, output_json)
         
         assert isinstance(result, str)
         assert result == str(output_json)
 
-    def test_stats_json_format(self, tmp_path):
+    def test_stats_json_format(self, tmp_path, sample_parquet):
         """Test that stats JSON is properly formatted."""
-        parquet_path = tmp_path / "input.parquet"
         output_json = tmp_path / "stats.json"
         
         data = [
             {"id": "1", "type": "PushEvent", "actor_login": "alice", "repo_name": "alice/repo1"},
             {"id": "2", "type": "IssuesEvent", "actor_login": "bob", "repo_name": "bob/repo2"},
         ]
-        self._create_sample_parquet(parquet_path, data)
+        parquet_path = sample_parquet("stats_json_format", data)
         
         generate_stats(parquet_path, output_json)
         
@@ -325,3 +433,25 @@ class TestGenerateStats:
         json_str = json.dumps(stats, indent=2)
         assert len(json_str) > 0
 
+    def test_atomic_write_using_temp_file(self, tmp_path, sample_parquet):
+        """Test that stats are written via a temp file that is renamed away."""
+        output_json = tmp_path / "stats.json"
+        
+        parquet_path = sample_parquet("single_push", SINGLE_PUSH)
+        
+        generate_stats(parquet_path, output_json)
+        
+        assert output_json.exists()
+        assert list(tmp_path.glob(f".{output_json.name}.*tmp")) == []
+
+    def test_records_source_signature_without_touching_input(self, tmp_path, sample_parquet):
+        """Test that stats record the input's signature, leave it unmodified and are reproducible."""
+        parquet_path = sample_parquet("single_push", SINGLE_PUSH)
+        signature = _source_signature(parquet_path)
+        
+        generate_stats(parquet_path, tmp_path / "a.json")
+        generate_stats(parquet_path, tmp_path / "b.json")
+        
+        assert _source_signature(parquet_path) == signature
+        assert json.loads((tmp_path / "a.json").read_text())[SOURCE_SIGNATURE_KEY] == signature
+        assert (tmp_path / "a.json").read_bytes() == (tmp_path / "b.json").read_bytes()
@@ -1,12 +1,22 @@
 """Tests for gh_archive.jobs.transform module."""
 import gzip
 import json
+from functools import partial
 from pathlib import Path
+from unittest.mock import patch
 
 import pandas as pd
+import pyarrow.parquet as pq
+from pyarrow import json as pa_json
 import pytest
 
-from gh_archive.jobs.transform import extract_important_columns, transform_json_to_parquet
+from gh_archive.jobs import transform as transform_module
+from gh_archive.jobs.transform import (
+    COLUMNS,
+    extract_important_columns,
+    set_important_columns,
+    transform_json_to_parquet,
+)
 
 
 class TestExtractImportantColumns:
@@ -110,6 +120,49 @@ class TestExtractImportantColumns:
         assert result["actor_login"] is None
         assert result["actor_type"] is None
 
+    @pytest.mark.parametrize("actor", [[], "octocat", 42], ids=["empty-list", "string", "int"])
+    def test_handle_unexpected_actor_types(self, actor):
+        """Test that non-dict actors, truthy or not, leave actor fields empty but keep the row."""
+        event = {"id": "123", "type": "PushEvent", "actor": actor, "repo": {"name": "octo/repo"}}
+        result = extract_important_columns(event)
+        
+        assert result["actor_id"] is None
+        assert result["actor_login"] is None
+        assert result["repo_name"] == "octo/repo"
+
+
+class TestSetImportantColumns:
+    """Test cases for set_important_columns function."""
+
+    def test_fills_one_row_per_event(self):
+        """Test that each event fills exactly its own row in every column."""
+        columns = {name: [None] * 2 for name in COLUMNS}
+        events = [
+            {"id": "1", "type": "PushEvent", "actor": {"login": "alice"}, "payload": {"size": 1}},
+            {"id": "2", "type": "IssuesEvent", "repo": None, "payload": {"action": "opened"}},
+        ]
+        for row, event in enumerate(events):
+            set_important_columns(columns, row, event)
+        
+        assert columns["id"] == ["1", "2"]
+        assert columns["actor_login"] == ["alice", None]
+        assert columns["payload_size"] == [1, None]
+        assert columns["payload_action"] == [None, "opened"]
+
+    def test_matches_extract_important_columns(self):
+        """Test that columnar output matches the per-event dict output."""
+        event = {
+            "id": "123",
+            "type": "PushEvent",
+            "actor": {"id": 10, "login": "alice", "type": "User"},
+            "org": {"id": 5, "login": "myorg"},
+            "payload": {"size": 3, "distinct_size": 2},
+        }
+        columns = {name: [None] for name in COLUMNS}
+        set_important_columns(columns, 0, event)
+        
+        assert {name: values[0] for name, values in columns.items()} == extract_important_columns(event)
+
 
 class TestTransformJsonToParquet:
     """Test cases for transform_json_to_parquet function."""
@@ -251,12 +304,162 @@ class TestTransformJsonToParquet:
         # Should have 2 valid events
         assert len(df) == 2
 
+    def test_parses_events_longer_than_parse_block_with_arrow(self, tmp_path):
+        """Test that an event longer than Arrow's parse block does not force the line parser."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        events = [{"id": str(i), "type": "PushEvent", "payload": {"body": "x" * 300}} for i in range(10)]
+        self._create_sample_json_gz(input_gz, events)
+        
+        small_parse_blocks = pa_json.ReadOptions(use_threads=True, block_size=64)
+        with patch("gh_archive.jobs.transform._READ_OPTIONS", small_parse_blocks), \
+                patch("gh_archive.jobs.transform._parse_block_lines") as mock_lines:
+            transform_json_to_parquet(input_gz, output_parquet)
+        
+        mock_lines.assert_not_called()
+        assert pd.read_parquet(output_parquet)["id"].tolist() == [str(i) for i in range(10)]
+
+    def test_parses_created_at_alike_on_both_paths(self, tmp_path):
+        """Test that a timestamp gets the same value whether or not its block is malformed."""
+        timestamps = ["2024-01-01T15:30:00Z", "2024-01-01T15:30:00.123Z", "2024-01-01T15:30:00+01:00", "2024-01-01T15:30:00"]
+        events = [{"id": str(i), "type": "PushEvent", "created_at": ts} for i, ts in enumerate(timestamps)]
+        
+        results = []
+        for malformed in (False, True):
+            input_gz = tmp_path / f"input{malformed}.json.gz"
+            output_parquet = tmp_path / f"output{malformed}.parquet"
+            self._create_sample_json_gz(input_gz, events)
+            if malformed:
+                with gzip.open(input_gz, "at", encoding="utf-8") as f:
+                    f.write('{"id": "x", "created_at": "not a timestamp"}\n')
+            transform_json_to_parquet(input_gz, output_parquet)
+            results.append(pd.read_parquet(output_parquet)["created_at"].tolist())
+        
+        arrow, fallback = results
+        assert fallback[:4] == arrow
+        assert pd.isna(fallback[4])
+        assert arrow[2] == pd.Timestamp("2024-01-01T14:30:00Z")
+
+    def test_nulls_values_of_unexpected_type(self, tmp_path):
+        """Test that a value of the wrong JSON type nulls that field without failing the file."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        events = [
+            {"id": "1", "type": "PushEvent", "created_at": 1704122400, "actor": {"id": "abc", "login": "alice"}},
+            {"id": "2", "type": "PushEvent", "public": "yes", "repo": {"id": True, "name": "octo/repo"}},
+            {"id": "3", "type": "PushEvent", "actor": {"id": 7}, "org": {"id": 1 << 70}},
+        ]
+        self._create_sample_json_gz(input_gz, events)
+        
+        transform_json_to_parquet(input_gz, output_parquet)
+        
+        df = pd.read_parquet(output_parquet)
+        assert df["id"].tolist() == ["1", "2", "3"]
+        assert df["created_at"].isna().all()
+        assert df["actor_login"].tolist()[0] == "alice"
+        assert pd.isna(df["actor_id"].tolist()[0])
+        assert df["actor_id"].tolist()[2] == 7
+        assert pd.isna(df["public"].tolist()[1])
+        assert pd.isna(df["repo_id"].tolist()[1])
+        assert df["repo_name"].tolist()[1] == "octo/repo"
+        assert pd.isna(df["org_id"].tolist()[2])
+
+    @pytest.mark.parametrize("malformed", [False, True], ids=["arrow", "fallback"])
+    def test_skips_empty_events(self, tmp_path, malformed):
+        """Test that `{}` lines are skipped whichever parser handles their block."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        
+        with gzip.open(input_gz, "wt", encoding="utf-8") as f:
+            for i in range(50):
+                f.write(json.dumps({"id": str(i), "type": "PushEvent"}) + "\n")
+                if i == 25:
+                    f.write("{}\n")
+            if malformed:
+                f.write("invalid json line\n")
+        
+        transform_json_to_parquet(input_gz, output_parquet)
+        
+        df = pd.read_parquet(output_parquet)
+        assert df["id"].tolist() == [str(i) for i in range(50)]
+
+    def test_skips_invalid_utf8_lines(self, tmp_path):
+        """Test that a line with invalid UTF-8 is skipped instead of written as a corrupt string."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        
+        with gzip.open(input_gz, "wb") as f:
+            f.write(b'{"id": "1", "type": "PushEvent"}\n')
+            f.write(b'{"id": "2\xff", "type": "PushEvent"}\n')
+            f.write(b'{"id": "3", "type": "PushEvent"}\n')
+        
+        transform_json_to_parquet(input_gz, output_parquet)
+        
+        table = pq.read_table(output_parquet)
+        table.validate(full=True)
+        assert table.column("id").to_pylist() == ["1", "3"]
+
+    def test_skips_non_object_lines_without_parsing(self, tmp_path):
+        """Test that lines that cannot be JSON objects are rejected before the JSON parser."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        
+        with gzip.open(input_gz, "wt", encoding="utf-8") as f:
+            f.write('{"id": "1", "type": "PushEvent"}\n')
+            f.write("[1, 2]\n")
+            f.write("truncated {\"id\": \"2\"}\n")
+            f.write('{"id": "3", "type": "IssuesEvent"}\r\n')
+        
+        with patch("gh_archive.jobs.transform.orjson.loads", wraps=transform_module.orjson.loads) as mock_loads:
+            transform_json_to_parquet(input_gz, output_parquet)
+        
+        assert mock_loads.call_count == 2
+        df = pd.read_parquet(output_parquet)
+        assert df["id"].tolist() == ["1", "3"]
+
+    def test_handles_unexpected_field_types(self, tmp_path):
+        """Test that lines with unexpected nested types fall back to lenient parsing."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        
+        events = [
+            {"id": "1", "type": "PushEvent", "actor": {"id": 10, "login": "alice"}},
+            {"id": "2", "type": "IssuesEvent", "actor": "bob"},
+        ]
+        self._create_sample_json_gz(input_gz, events)
+        
+        transform_json_to_parquet(input_gz, output_parquet)
+        
+        df = pd.read_parquet(output_parquet)
+        assert len(df) == 2
+        assert df["actor_login"].tolist()[0] == "alice"
+        assert pd.isna(df["actor_login"].tolist()[1])
+
+    def test_writes_typed_columns(self, tmp_path):
+        """Test that created_at is a UTC timestamp and low-cardinality strings are categorical."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        
+        events = [
+            {"id": "1", "type": "PushEvent", "created_at": "2024-01-01T15:30:00Z", "actor": {"type": "User"}},
+            {"id": "2", "type": "PushEvent", "created_at": "not a timestamp"},
+        ]
+        self._create_sample_json_gz(input_gz, events)
+        
+        transform_json_to_parquet(input_gz, output_parquet)
+        
+        df = pd.read_parquet(output_parquet)
+        assert df["created_at"].tolist()[0] == pd.Timestamp("2024-01-01T15:30:00Z")
+        assert pd.isna(df["created_at"].tolist()[1])
+        assert isinstance(df["type"].dtype, pd.CategoricalDtype)
+        assert isinstance(df["actor_type"].dtype, pd.CategoricalDtype)
+
     def test_handles_large_file_chunked(self, tmp_path):
         """Test that large files are processed in chunks."""
         input_gz = tmp_path / "input.json.gz"
         output_parquet = tmp_path / "output.parquet"
         
-        # Create file with more than CHUNK_SIZE events (10000)
+        # Create file with many events
         events = [
             {"id": str(i), "type": "PushEvent", "actor": {"login": f"user{i}"}}
             for i in range(15000)
@@ -269,6 +472,90 @@ class TestTransformJsonToParquet:
         df = pd.read_parquet(output_parquet)
         assert len(df) == 15000
 
+    def test_keeps_order_across_read_blocks(self, tmp_path):
+        """Test that events split over many read-ahead blocks keep their order."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        events = [{"id": str(i), "type": "PushEvent"} for i in range(500)]
+        self._create_sample_json_gz(input_gz, events)
+        
+        small_blocks = partial(transform_module._iter_line_blocks, block_size=1024)
+        with patch("gh_archive.jobs.transform._iter_line_blocks", small_blocks):
+            transform_json_to_parquet(input_gz, output_parquet)
+        
+        df = pd.read_parquet(output_parquet)
+        assert df["id"].tolist() == [str(i) for i in range(500)]
+
+    def test_keeps_lines_longer_than_read_block(self, tmp_path):
+        """Test that a line spanning several read blocks is parsed whole."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        events = [{"id": str(i), "type": "PushEvent", "repo": {"name": f"owner/repo{i}"}} for i in range(50)]
+        self._create_sample_json_gz(input_gz, events)
+        
+        tiny_blocks = partial(transform_module._iter_line_blocks, block_size=16)
+        with patch("gh_archive.jobs.transform._iter_line_blocks", tiny_blocks):
+            transform_json_to_parquet(input_gz, output_parquet)
+        
+        df = pd.read_parquet(output_parquet)
+        assert df["repo_name"].tolist() == [f"owner/repo{i}" for i in range(50)]
+
+    def test_parallel_decompression_matches_serial(self, tmp_path):
+        """Test that rapidgzip and igzip produce identical output for a multi-member file."""
+        pytest.importorskip("rapidgzip")
+        input_gz = tmp_path / "input.json.gz"
+        
+        # Concatenated gzip members, as written by pigz
+        events = [{"id": str(i), "type": "PushEvent", "actor": {"login": f"user{i}"}} for i in range(20000)]
+        input_gz.write_bytes(b"".join(
+            gzip.compress("".join(json.dumps(event) + "\n" for event in events[i:i + 5000]).encode("utf-8"))
+            for i in range(0, len(events), 5000)
+        ))
+        
+        with patch("gh_archive.jobs.transform.DECOMPRESS_THREADS", 1):
+            transform_json_to_parquet(input_gz, tmp_path / "serial.parquet")
+        with patch("gh_archive.jobs.transform.DECOMPRESS_THREADS", 4):
+            transform_json_to_parquet(input_gz, tmp_path / "parallel.parquet")
+        
+        serial = pd.read_parquet(tmp_path / "serial.parquet")
+        assert len(serial) == 20000
+        pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "parallel.parquet"), serial)
+
+    def test_combines_blocks_into_row_groups(self, tmp_path):
+        """Test that small parsed blocks are combined into ROW_GROUP_SIZE row groups."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        events = [{"id": str(i), "type": "PushEvent"} for i in range(500)]
+        self._create_sample_json_gz(input_gz, events)
+        
+        small_blocks = partial(transform_module._iter_line_blocks, block_size=1024)
+        with patch("gh_archive.jobs.transform._iter_line_blocks", small_blocks), \
+                patch("gh_archive.jobs.transform.ROW_GROUP_SIZE", 200):
+            transform_json_to_parquet(input_gz, output_parquet)
+        
+        metadata = pq.ParquetFile(output_parquet).metadata
+        assert metadata.num_rows == 500
+        assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [200, 200, 100]
+        assert metadata.row_group(0).column(0).compression == "ZSTD"
+
+    def test_dictionary_encodes_repeated_columns_only(self, tmp_path):
+        """Test that repeated values are dictionary-encoded and unique event ids are not."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        events = [
+            {"id": str(i), "type": "PushEvent", "actor": {"login": f"user{i % 10}"}, "repo": {"name": f"repo{i % 20}"}}
+            for i in range(10000)
+        ]
+        self._create_sample_json_gz(input_gz, events)
+        
+        transform_json_to_parquet(input_gz, output_parquet)
+        
+        row_group = pq.ParquetFile(output_parquet).metadata.row_group(0)
+        encodings = {row_group.column(i).path_in_schema: row_group.column(i).encodings for i in range(row_group.num_columns)}
+        assert "RLE_DICTIONARY" not in encodings["id"]
+        assert "RLE_DICTIONARY" in encodings["actor_login"]
+        assert "RLE_DICTIONARY" in encodings["repo_name"]
+
     def test_handles_path_objects(self, tmp_path):
         """Test that function accepts Path objects."""
         input_gz = tmp_path / "input.json.gz"
@@ -307,9 +594,8 @@ class TestTransformJsonToParquet:
         
         transform_json_to_parquet(input_gz, output_parquet)
         
-        # Verify temp file doesn't exist after successful transform
-        temp_file = output_parquet.parent / f".{output_parquet.name}.tmp"
-        assert not temp_file.exists()
+        # Verify no temp file is left after successful transform
+        assert list(tmp_path.glob(f".{output_parquet.name}.*tmp")) == []
         assert output_parquet.exists()
 
     def test_cleanup_temp_file_on_error(self, tmp_path):
@@ -321,10 +607,36 @@ class TestTransformJsonToParquet:
             transform_json_to_parquet(input_gz, output_parquet)
         
         # Temp file should be cleaned up
-        temp_file = output_parquet.parent / f".{output_parquet.name}.tmp"
-        assert not temp_file.exists()
+        assert list(tmp_path.glob(f".{output_parquet.name}.*tmp")) == []
         assert not output_parquet.exists()
 
+    def test_uses_unique_temp_file_and_fsyncs(self, tmp_path):
+        """Test that each write gets its own temp file and is made durable before returning."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        self._create_sample_json_gz(input_gz, [{"id": "1", "type": "PushEvent"}])
+        
+        with patch("gh_archive.jobs.transform.durable_replace", wraps=transform_module.durable_replace) as mock_replace:
+            transform_json_to_parquet(input_gz, output_parquet)
+            transform_json_to_parquet(input_gz, output_parquet, overwrite=True)
+        
+        first, second = (call.args[0] for call in mock_replace.call_args_list)
+        assert first != second
+        assert first.parent == tmp_path and first.name.startswith(".output.parquet.")
+        assert mock_replace.call_args.args[1] == output_parquet
+
+    def test_drops_input_from_page_cache(self, tmp_path):
+        """Test that the raw input is evicted from the page cache once it has been read."""
+        input_gz = tmp_path / "input.json.gz"
+        output_parquet = tmp_path / "output.parquet"
+        self._create_sample_json_gz(input_gz, [{"id": "1", "type": "PushEvent"}])
+        
+        with patch("gh_archive.jobs.transform.drop_page_cache", wraps=transform_module.drop_page_cache) as mock_drop:
+            transform_json_to_parquet(input_gz, output_parquet)
+        
+        mock_drop.assert_called_once_with(input_gz)
+        assert len(pd.read_parquet(output_parquet)) == 1
+
     def test_returns_string_path(self, tmp_path):
         """Test that function returns string path, not Path object."""
         input_gz = tmp_path / "input.json.gz"